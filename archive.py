@@ -0,0 +1,167 @@
+"""解析出的信号批量归档到数据库 signals 表"""
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from persistence import flush_loop
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# BIGINT 的取值范围，解析出的数字只受正则 \d+ 限制，超出时截断
+_BIGINT_MAX = 2**63 - 1
+
+ARCHIVE_COLUMNS = (
+    "ca_address",
+    "level",
+    "twitter_score",
+    "current_market_value",
+    "followers",
+    "source_chat_id",
+    "message_id",
+    "message_time",
+    "received_at",
+    "raw_message",
+)
+
+
+class SignalArchive:
+    """把每条解析出的信号写入 signals 表
+
+    消息处理路径只把记录追加到内存缓冲区，由后台任务在缓冲区达到 batch_size 或每隔
+    flush_interval 秒时用 COPY 批量写入，转发路径上没有数据库往返。数据库不可用时记录
+    保留在缓冲区等待重试，超过 max_buffered 条后丢弃最旧的记录。
+    """
+
+    def __init__(
+        self,
+        pool,
+        batch_size: int = 1000,
+        flush_interval: float = 2.0,
+        max_buffered: int = 100_000,
+    ):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer: deque = deque(maxlen=max_buffered)
+        self._flush_event = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.added = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    async def start(self):
+        """建表、建索引并启动后台批量写入任务"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS signals (
+                    id BIGSERIAL PRIMARY KEY,
+                    ca_address TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    twitter_score BIGINT NOT NULL DEFAULT 0,
+                    current_market_value BIGINT NOT NULL DEFAULT 0,
+                    followers BIGINT NOT NULL DEFAULT 0,
+                    source_chat_id BIGINT,
+                    message_id BIGINT,
+                    message_time TIMESTAMPTZ,
+                    received_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    raw_message TEXT
+                )
+                """
+            )
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS signals_ca_address_idx ON signals (ca_address)"
+            )
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS signals_received_at_idx ON signals (received_at)"
+            )
+
+        self._flush_task = asyncio.create_task(
+            flush_loop(self._flush_event, self.flush_interval, self.flush)
+        )
+        logger.info("信号归档已启动")
+
+    def add(
+        self,
+        data: Dict[str, Any],
+        source_chat_id: Optional[int] = None,
+        message_id: Optional[int] = None,
+        message_time: Optional[datetime] = None,
+    ):
+        """追加一条解析结果，不等待写入"""
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(
+            (
+                data["ca_address"],
+                data["level"],
+                min(data["twitter_score"], _BIGINT_MAX),
+                min(data["current_market_value"], _BIGINT_MAX),
+                min(data["followers"], _BIGINT_MAX),
+                source_chat_id,
+                message_id,
+                message_time,
+                datetime.now(timezone.utc),
+                data["raw_message"],
+            )
+        )
+        self.added += 1
+        if len(self._buffer) >= self.batch_size:
+            self._flush_event.set()
+
+    async def flush(self):
+        """用 COPY 把缓冲区写入数据库，失败时放回缓冲区下次重试"""
+        if not self._buffer:
+            return
+
+        batch = list(self._buffer)
+        self._buffer.clear()
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.copy_records_to_table(
+                    "signals", records=batch, columns=ARCHIVE_COLUMNS
+                )
+            self.written += len(batch)
+            self.flushes += 1
+        except asyncio.CancelledError:
+            self._requeue(batch)
+            raise
+        except Exception as e:
+            logger.error(f"归档 {len(batch)} 条信号失败，将在下次重试: {e}")
+            self._requeue(batch)
+
+    def _requeue(self, batch):
+        # 失败的批次放回队首，期间新增的记录排在后面；超出容量时丢弃最旧的
+        combined = batch + list(self._buffer)
+        overflow = len(combined) - self._buffer.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+            combined = combined[overflow:]
+        self._buffer.clear()
+        self._buffer.extend(combined)
+
+    async def close(self):
+        """停止后台任务并写入剩余记录"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "added": self.added,
+            "written": self.written,
+            "pending": len(self._buffer),
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+        }
@@ -0,0 +1,407 @@
+"""补读监听频道在启动前和漏收的历史消息"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from telethon import utils
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.tl.types import Message
+
+from channel_router import peer_id_variants
+from persistence import DelayedSave, write_json_atomic
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+
+class FileCheckpointStore:
+    """保存在本地JSON文件中的频道处理进度"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def load(self) -> Dict[int, int]:
+        if not os.path.exists(self.path):
+            return {}
+        return await asyncio.to_thread(self._read)
+
+    def _read(self) -> Dict[int, int]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {int(chat_id): int(message_id) for chat_id, message_id in data.items()}
+
+    async def save(self, checkpoints: Dict[int, int]):
+        await asyncio.to_thread(self._write, checkpoints)
+
+    def _write(self, checkpoints: Dict[int, int]):
+        write_json_atomic(self.path, {str(k): v for k, v in checkpoints.items()})
+
+
+class DbCheckpointStore:
+    """保存在数据库 channel_checkpoints 表中的频道处理进度"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def load(self) -> Dict[int, int]:
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS channel_checkpoints (
+                    chat_id BIGINT PRIMARY KEY,
+                    last_message_id BIGINT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+            records = await conn.fetch(
+                "SELECT chat_id, last_message_id FROM channel_checkpoints"
+            )
+        return {r["chat_id"]: r["last_message_id"] for r in records}
+
+    async def save(self, checkpoints: Dict[int, int]):
+        async with self.pool.acquire() as conn:
+            # 多个实例共用时只前进不后退
+            await conn.executemany(
+                """
+                INSERT INTO channel_checkpoints (chat_id, last_message_id)
+                VALUES ($1, $2)
+                ON CONFLICT (chat_id) DO UPDATE
+                SET last_message_id = GREATEST(channel_checkpoints.last_message_id, $2),
+                    updated_at = now()
+                """,
+                list(checkpoints.items()),
+            )
+
+
+class HistoryMessage:
+    """补读到的消息，只保留处理流程用到的字段"""
+
+    __slots__ = ("id", "date", "text")
+
+    def __init__(self, message_id: int, date: datetime, text: str):
+        self.id = message_id
+        self.date = date
+        self.text = text
+
+
+class HistoryEvent:
+    """补读消息交给处理流程时使用的事件，字段与 NewMessage 事件一致"""
+
+    __slots__ = ("message", "chat_id", "sender_id")
+
+    def __init__(self, message: HistoryMessage, chat_id: int, sender_id: Optional[int]):
+        self.message = message
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+
+    def __repr__(self):
+        return f"HistoryEvent(chat_id={self.chat_id}, message_id={self.message.id})"
+
+
+class Backfill:
+    """记录每个监听频道的处理进度，补读启动前和漏收的消息
+
+    实时消息在处理时调用 mark() 推进进度，进度在后台合并写回存储。需要补读的范围单独
+    记录为缺口，不受实时进度影响：
+    - 启动时装载的进度是一个缺口，从该进度到这个频道收到的第一条实时消息为止
+    - 实时消息到达时调用 observe()，消息ID比上一条收到的大于1时说明中间有消息没有
+      收到（连接中断、重连期间的更新丢失等），两者之间是一个缺口。不依赖能否观察到
+      断线，多短的中断都能发现
+    缺口还没补读完时，写回存储的进度不超过缺口起点，重启后不会丢失。读取失败的缺口放回
+    队列，FloodWait 时等提示的秒数，其他错误等 retry_delay 秒后重试。
+
+    补读时按频道并发 (最多 concurrency 个) 用 GetHistoryRequest 从新到旧翻页读取缺口
+    内的消息，遇到早于 max_age 秒的消息或达到 max_messages 条时停止，然后按从旧到新的
+    顺序交给正常的解析/筛选/去重流程。没有进度记录的频道不补读，从下一条实时消息开始
+    记录。
+    """
+
+    def __init__(
+        self,
+        client,
+        store,
+        handler: Callable[[HistoryEvent], Awaitable[None]],
+        max_age: float = 600.0,
+        concurrency: int = 4,
+        max_messages: int = 500,
+        page_size: int = 100,
+        retry_delay: float = 30.0,
+    ):
+        self.client = client
+        self.store = store
+        self.handler = handler
+        self.max_age = timedelta(seconds=max_age)
+        self.max_messages = max_messages
+        self.page_size = page_size
+        self.retry_delay = retry_delay
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        # 已处理到的消息ID（写回存储）
+        self._checkpoints: Dict[int, int] = {}
+        # 实时收到的最后一条消息ID
+        self._seen: Dict[int, int] = {}
+        # 待补读的缺口: chat_id -> (min_id, max_id)，不含两端，max_id 为0表示到最新
+        self._gaps: Dict[int, Tuple[int, int]] = {}
+        # 正在补读的缺口，补读完之前同样限制写回的进度
+        self._fetching: Dict[int, Tuple[int, int]] = {}
+        # 补读失败的频道最早什么时候重试（time.monotonic）
+        self._retry_at: Dict[int, float] = {}
+        # 补读的频道（标记ID），配置热加载时更新
+        self._channel_ids: Set[int] = set()
+        self._saver = DelayedSave(self.save)
+        self._run_task: Optional[asyncio.Task] = None
+        self._retry_task: Optional[asyncio.Task] = None
+        self._started = False
+
+        self.runs = 0
+        self.gaps_found = 0
+        self.failures = 0
+        self.fetched = 0
+        self.processed = 0
+        # 因达到 max_age 停止翻页的次数
+        self.age_limited = 0
+
+    @property
+    def channel_ids(self) -> Set[int]:
+        return self._channel_ids
+
+    @channel_ids.setter
+    def channel_ids(self, channel_ids: Iterable[int]):
+        # 进度和缺口按 event.chat_id 的标记ID记录，配置中的正数ID与 ChannelRouter 一样
+        # 登记全部可能的标记ID
+        self._channel_ids = {
+            peer_id for chat_id in channel_ids for peer_id in peer_id_variants(chat_id)
+        }
+
+    async def load(self):
+        """从存储装载进度，每个频道从装载的进度开始补读"""
+        try:
+            checkpoints = await self.store.load()
+        except Exception as e:
+            logger.error(f"装载频道处理进度失败: {e}")
+            return
+        for chat_id, message_id in checkpoints.items():
+            if message_id > self._checkpoints.get(chat_id, 0):
+                self._checkpoints[chat_id] = message_id
+            self._add_gap(chat_id, message_id, self._seen.get(chat_id, 0))
+        logger.info(f"已装载 {len(checkpoints)} 个频道的处理进度")
+
+    def mark(self, chat_id: int, message_id: int):
+        """记录已处理的消息，进度只前进"""
+        if message_id > self._checkpoints.get(chat_id, 0):
+            self._checkpoints[chat_id] = message_id
+            # 合并短时间内的多次推进
+            self._saver.schedule()
+
+    def observe(self, chat_id: int, message_id: int):
+        """记录实时收到的消息ID，发现缺口时在后台补读"""
+        if chat_id not in self.channel_ids:
+            return
+        last = self._seen.get(chat_id)
+        if last is not None and message_id <= last:
+            return
+        self._seen[chat_id] = message_id
+
+        if last is None:
+            # 第一条实时消息之前的部分由启动时的缺口补读
+            gap = self._gaps.get(chat_id)
+            if gap is not None and not gap[1]:
+                self._gaps[chat_id] = (gap[0], message_id)
+            return
+        if message_id > last + 1:
+            self.gaps_found += 1
+            logger.info(f"频道 {chat_id} 的消息 {last} 与 {message_id} 之间有未收到的消息，开始补读")
+            self._add_gap(chat_id, last, message_id)
+            if self._started:
+                self._run_in_background()
+
+    def _add_gap(self, chat_id: int, min_id: int, max_id: int):
+        """记录缺口，与已有的缺口合并"""
+        gap = self._gaps.get(chat_id)
+        if gap is not None:
+            min_id = min(min_id, gap[0])
+            max_id = 0 if not max_id or not gap[1] else max(max_id, gap[1])
+        self._gaps[chat_id] = (min_id, max_id)
+
+    async def save(self):
+        """把进度写回存储，未补读完的缺口之后的进度不写入"""
+        if self.store is None:
+            return
+        checkpoints = dict(self._checkpoints)
+        for gaps in (self._gaps, self._fetching):
+            for chat_id, (min_id, _) in gaps.items():
+                checkpoints[chat_id] = min(checkpoints.get(chat_id, min_id), min_id)
+        if not checkpoints:
+            return
+        try:
+            await self.store.save(checkpoints)
+        except Exception as e:
+            logger.error(f"保存频道处理进度失败: {e}")
+
+    def start(self, channel_ids: Iterable[int]):
+        """在后台补读启动前错过的消息，之后发现缺口时再补读"""
+        self.channel_ids = channel_ids
+        self._started = True
+        self._run_in_background()
+
+    def _run_in_background(self):
+        if self._run_task is not None and not self._run_task.done():
+            # 正在补读时新发现的缺口在本轮结束后处理
+            return
+        self._run_task = asyncio.create_task(self._run_pending())
+
+    async def _run_pending(self):
+        while True:
+            now = time.monotonic()
+            channel_ids = [
+                c
+                for c in self._gaps
+                if c in self.channel_ids and self._retry_at.get(c, 0.0) <= now
+            ]
+            if not channel_ids:
+                self._schedule_retry()
+                return
+            await self.run(channel_ids)
+
+    def _schedule_retry(self):
+        """补读失败的缺口到了重试时间后再运行一轮"""
+        retry_at = [
+            self._retry_at[c]
+            for c in self._gaps
+            if c in self.channel_ids and c in self._retry_at
+        ]
+        if not retry_at:
+            return
+        if self._retry_task is not None and not self._retry_task.done():
+            self._retry_task.cancel()
+        self._retry_task = asyncio.create_task(
+            self._run_later(min(retry_at) - time.monotonic())
+        )
+
+    async def _run_later(self, delay: float):
+        await asyncio.sleep(max(0.0, delay))
+        self._run_in_background()
+
+    async def run(self, channel_ids: Iterable[int]):
+        """并发补读这些频道的缺口，失败的缺口稍后重试"""
+        gaps = {}
+        for channel_id in channel_ids:
+            gap = self._gaps.pop(channel_id, None)
+            if gap is not None:
+                gaps[channel_id] = self._fetching[channel_id] = gap
+        if not gaps:
+            return
+        self.runs += 1
+        results = await asyncio.gather(
+            *(self._guarded(channel_id, gap) for channel_id, gap in gaps.items()),
+            return_exceptions=True,
+        )
+        for (channel_id, gap), result in zip(gaps.items(), results):
+            del self._fetching[channel_id]
+            if not isinstance(result, Exception):
+                self._retry_at.pop(channel_id, None)
+                continue
+            # 放回缺口，FloodWait 时等提示的秒数，其他错误等 retry_delay 秒后重试
+            self.failures += 1
+            delay = (
+                result.seconds if isinstance(result, FloodWaitError) else self.retry_delay
+            )
+            self._add_gap(channel_id, *gap)
+            self._retry_at[channel_id] = time.monotonic() + delay
+            logger.error(f"补读频道 {channel_id} 失败，{delay} 秒后重试: {result}")
+        await self.save()
+
+    async def _guarded(self, channel_id: int, gap: Tuple[int, int]):
+        # 只限制同时翻页的频道数，处理补读到的消息时不占名额
+        async with self._semaphore:
+            chat_id, messages = await self.fetch_channel(channel_id, *gap)
+        if not messages:
+            return
+
+        logger.info(f"频道 {channel_id} 补读到 {len(messages)} 条错过的消息")
+        # 从旧到新处理，与实时消息的顺序一致
+        for message in reversed(messages):
+            sender_id = utils.get_peer_id(message.from_id) if message.from_id else None
+            event = HistoryEvent(
+                HistoryMessage(message.id, message.date, self._text(message)),
+                chat_id,
+                sender_id,
+            )
+            # 单条消息处理失败不影响缺口中的其他消息
+            try:
+                await self.handler(event)
+            except Exception as e:
+                logger.error(f"处理频道 {channel_id} 补读的消息 {message.id} 失败: {e}")
+            self.processed += 1
+
+    async def fetch_channel(self, channel_id: int, min_id: int, max_id: int = 0):
+        """读取一个频道 min_id 与 max_id 之间的消息，返回 (标记ID, 从新到旧的消息列表)"""
+        peer = await self.client.get_input_entity(channel_id)
+        chat_id = utils.get_peer_id(peer)
+        cutoff = datetime.now(timezone.utc) - self.max_age
+        return chat_id, await self._fetch_between(peer, min_id, max_id, cutoff)
+
+    async def _fetch_between(
+        self, peer, min_id: int, max_id: int, cutoff: datetime
+    ) -> List[Message]:
+        """从新到旧翻页读取 min_id 与 max_id 之间、cutoff 之后的消息"""
+        collected: List[Message] = []
+        offset_id = max_id
+        while len(collected) < self.max_messages:
+            result = await self.client(
+                GetHistoryRequest(
+                    peer=peer,
+                    offset_id=offset_id,
+                    offset_date=None,
+                    add_offset=0,
+                    limit=self.page_size,
+                    max_id=max_id,
+                    min_id=min_id,
+                    hash=0,
+                )
+            )
+            page = result.messages
+            self.fetched += len(page)
+            for message in page:
+                if message.date < cutoff:
+                    self.age_limited += 1
+                    return collected
+                # 跳过服务消息（入群、置顶等）
+                if isinstance(message, Message):
+                    collected.append(message)
+            if len(page) < self.page_size:
+                break
+            offset_id = page[-1].id
+        return collected[: self.max_messages]
+
+    def _text(self, message: Message) -> str:
+        # 与实时事件的 message.text 一致：按客户端的解析模式还原格式
+        parse_mode = self.client.parse_mode
+        if parse_mode is None or not message.message:
+            return message.message or ""
+        return parse_mode.unparse(message.message, message.entities)
+
+    async def close(self):
+        """停止后台任务并写回进度"""
+        for task in (self._run_task, self._retry_task):
+            if task is not None:
+                task.cancel()
+        await self.save()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "channels": len(self._checkpoints),
+            "runs": self.runs,
+            "gaps_found": self.gaps_found,
+            "failures": self.failures,
+            "pending_gaps": len(self._gaps),
+            "fetched": self.fetched,
+            "processed": self.processed,
+            "age_limited": self.age_limited,
+        }
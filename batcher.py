@@ -0,0 +1,198 @@
+"""把短时间内的多个CA合并成一条消息发送"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# Telegram 单条消息的最大长度
+MAX_MESSAGE_LENGTH = 4096
+
+Dispatch = Callable[[Iterable[int], str, float], Awaitable[Dict[int, bool]]]
+
+
+class OutboundBatcher:
+    """发送合并器
+
+    只有接收目标相同的CA才会合并，每组接收目标同时只有一批在发送，不同组的批次并发
+    发送，某组的目标在等待限速或 FloodWait 时不影响其他组。某组没有批次在发送、也
+    没有排队的CA时，新的CA立即单独发出，单条信号的延迟不变；该组发送进行中（例如在
+    等待限速令牌）到达的CA进入队列，上一批发完后，队列中最早的CA等满 window 秒或凑够
+    max_items 个就合并成一条消息（每行一个CA，不超过 max_length）发给它们的目标。
+    每个CA的调用方拿到的是所在批次的发送结果。
+
+    可以发送的批次中，优先级最高（按 aging 秒一级老化）的CA所在的批次先发，批次内的CA
+    也按这个顺序排列，超过 max_items 或 max_length 时留下的是优先级低的CA。批次按其中
+    最高的优先级交给 dispatch。
+    """
+
+    def __init__(
+        self,
+        dispatch: Dispatch,
+        window: float = 0.25,
+        max_items: int = 10,
+        max_length: int = MAX_MESSAGE_LENGTH,
+        separator: str = "\n",
+        aging: float = 5.0,
+    ):
+        self.dispatch = dispatch
+        self.window = window
+        self.max_items = max(1, max_items)
+        self.max_length = max_length
+        self.separator = separator
+        self.aging = aging
+
+        # (CA, 接收目标, 加入时间, 优先级, 等待结果的future, 最早可以发送的时间)
+        self._queue: List[
+            Tuple[str, Tuple[int, ...], float, float, asyncio.Future, float]
+        ] = []
+        # 有批次正在发送的接收目标组
+        self._sending: Set[Tuple[int, ...]] = set()
+        self._senders: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.items = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    async def submit(
+        self, targets: Iterable[int], text: str, priority: float = 0.0
+    ) -> Dict[int, bool]:
+        """加入一条发往 targets 的内容，返回所在批次每个目标是否发送成功"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        targets = tuple(targets)
+        now = time.monotonic()
+        # 该组空闲时立即发送，否则等待与之后到达的CA合并
+        idle = targets not in self._sending and all(
+            item[1] != targets for item in self._queue
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(
+            (text, targets, now, priority, future, now if idle else now + self.window)
+        )
+        self.items += 1
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            batch = self._take_batch(time.monotonic())
+            if batch:
+                self._start_batch(batch)
+                continue
+            timeout = self._next_ready()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _next_ready(self) -> Optional[float]:
+        """距离最早一个空闲组可以发送还有多少秒，没有时返回None"""
+        ready_at = [item[5] for item in self._queue if item[1] not in self._sending]
+        if not ready_at:
+            return None
+        return max(0.0, min(ready_at) - time.monotonic())
+
+    def _take_batch(self, now: float, force: bool = False):
+        """取出一个可以发送的批次：组内最早的CA到了发送时间或凑够 max_items 个"""
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for index, item in enumerate(self._queue):
+            if item[1] not in self._sending:
+                groups.setdefault(item[1], []).append(index)
+        ready = []
+        for indexes in groups.values():
+            if (
+                force
+                or len(indexes) >= self.max_items
+                or min(self._queue[i][5] for i in indexes) <= now
+            ):
+                ready.extend(indexes)
+        if not ready:
+            return None
+
+        # 老化后优先级最高的CA所在的组先发，组内也按老化后的优先级排列和截断
+        def aged(i):
+            return self._queue[i][2] - self._queue[i][3] * self.aging
+
+        group = self._queue[min(ready, key=aged)][1]
+        batch = []
+        taken = set()
+        length = -len(self.separator)
+        for index in sorted(groups[group], key=aged):
+            item = self._queue[index]
+            length += len(self.separator) + len(item[0])
+            if batch and (len(batch) >= self.max_items or length > self.max_length):
+                break
+            batch.append(item)
+            taken.add(index)
+        # 没有放进本批的CA留在队列里，保持原有顺序
+        self._queue = [item for index, item in enumerate(self._queue) if index not in taken]
+        return batch
+
+    def _start_batch(self, batch):
+        group = batch[0][1]
+        self._sending.add(group)
+        task = asyncio.create_task(self._send_batch(batch))
+        self._senders.add(task)
+
+        def done(task):
+            self._senders.discard(task)
+            self._sending.discard(group)
+            # 该组的下一批可以发送了
+            self._wakeup.set()
+
+        task.add_done_callback(done)
+
+    async def _send_batch(self, batch):
+        message_text = self.separator.join(item[0] for item in batch)
+        priority = max(item[3] for item in batch)
+        try:
+            results = await self.dispatch(batch[0][1], message_text, priority)
+        except asyncio.CancelledError:
+            for item in batch:
+                item[4].cancel()
+            raise
+        except Exception as e:
+            logger.error(f"合并发送 {len(batch)} 条内容失败: {e}")
+            results = {}
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        if len(batch) > 1:
+            logger.debug("已合并 %d 条内容为一条消息发送", len(batch))
+        for item in batch:
+            if not item[4].done():
+                item[4].set_result(results)
+
+    async def close(self):
+        """发完队列中剩余的内容后停止"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while self._queue or self._senders:
+            batch = self._take_batch(time.monotonic(), force=True)
+            if batch:
+                self._start_batch(batch)
+                continue
+            await asyncio.wait(self._senders, return_when=asyncio.FIRST_COMPLETED)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "pending": len(self._queue),
+            "sending": len(self._sending),
+        }
@@ -0,0 +1,187 @@
+"""解析与等级筛选的微基准, 带基线回归检查
+
+用法: python benchmarks/bench_core.py [--rounds N] [--trials N] [--level L] [--tolerance X] [--update-baseline]
+
+按语料分类(signal_zh 中文/emoji 模板, signal_en 英文变体, noise 非信号消息, edge 边界情况)
+以及全部消息, 测量每条消息处理中的纯CPU部分: parse_signal, 解析成功后再做 level_passes,
+与机器人收到消息时的顺序相同。输出:
+
+- 吞吐量 (条/秒), 在不计时的紧凑循环中测量, 各分类交替测 --trials 次 (默认5), 输出中位数
+- 单次调用耗时的 p50 / p99 (微秒), 逐次用 perf_counter_ns 计时, 含约几十纳秒的计时开销
+- 每条消息的内存分配: tracemalloc 测得的单次调用峰值字节数
+
+基线保存在 benchmarks/baseline.json, 与语料版本绑定, 记录吞吐量的中位数。默认与基线
+比较, 任一分类最快一次的吞吐量仍比基线下降超过 --tolerance (默认 0.2 即 20%) 时
+返回 2。基线数值与机器相关, 更换机器或 Python 版本后先用 --update-baseline 重新生成。
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from signal_parser import level_passes, parse_signal  # noqa: E402
+
+CORPUS_FILE = os.path.join(ROOT, "benchmarks", "corpus", "signals_v2.json")
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+
+def load_categories():
+    """读取版本化语料库, 返回 (版本, {分类: 消息列表})"""
+    with open(CORPUS_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    categories = dict(data["categories"])
+    categories["all"] = [text for messages in data["categories"].values() for text in messages]
+    return data["version"], categories
+
+
+def process(text, current_level):
+    """机器人处理一条消息时的纯CPU部分"""
+    data = parse_signal(text)
+    if data is not None:
+        level_passes(data["level"], current_level)
+
+
+def throughput(messages, rounds, current_level):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in messages:
+            process(text, current_level)
+    return rounds * len(messages) / (time.perf_counter() - start)
+
+
+def latencies(messages, rounds, current_level):
+    """返回 (p50, p99) 微秒"""
+    clock = time.perf_counter_ns
+    samples = []
+    for _ in range(rounds):
+        for text in messages:
+            start = clock()
+            process(text, current_level)
+            samples.append(clock() - start)
+    samples.sort()
+    return (
+        samples[len(samples) // 2] / 1000,
+        samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000,
+    )
+
+
+def allocated_bytes(messages, current_level):
+    """每条消息单次调用的平均峰值分配字节数"""
+    # 先跑一遍, 排除首次调用时的缓存和驻留字符串
+    for text in messages:
+        process(text, current_level)
+    tracemalloc.start()
+    total = 0
+    for text in messages:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        process(text, current_level)
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / len(messages)
+
+
+def run(categories, rounds, current_level, trials):
+    categories = {name: messages for name, messages in categories.items() if messages}
+    # 各分类交替测量吞吐量, 机器一段时间内变慢时不会只影响某一个分类
+    rates = {name: [] for name in categories}
+    for _ in range(trials):
+        for name, messages in categories.items():
+            rates[name].append(throughput(messages, rounds, current_level))
+
+    results = {}
+    for name, messages in categories.items():
+        p50, p99 = latencies(messages, max(1, rounds // 5), current_level)
+        samples = sorted(rates[name])
+        results[name] = {
+            "messages": len(messages),
+            "msgs_per_sec": round(samples[len(samples) // 2]),
+            "best_msgs_per_sec": round(samples[-1]),
+            "p50_us": round(p50, 2),
+            "p99_us": round(p99, 2),
+            "alloc_bytes": round(allocated_bytes(messages, current_level)),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """打印与基线的对比, 返回吞吐量回归的分类列表"""
+    regressions = []
+    print(f"\n与基线比较 (基线生成于 Python {baseline.get('python', '?')}):")
+    for name, row in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"  {name:<10} 基线中没有该分类")
+            continue
+        # 最快一次与基线的中位数比较: 偶尔变慢的一次不算回归, 真实的变慢每次都会出现
+        ratio = row["best_msgs_per_sec"] / base["msgs_per_sec"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+            flag = "  <-- 吞吐量回归"
+        print(
+            f"  {name:<10} 吞吐量 {ratio:>6.1%}  "
+            f"p99 {row['p99_us']:.2f}us (基线 {base['p99_us']:.2f}us)  "
+            f"分配 {row['alloc_bytes']}B (基线 {base['alloc_bytes']}B){flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--level", default="Normal")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    version, categories = load_categories()
+    results = run(categories, args.rounds, args.level, args.trials)
+
+    print(f"语料版本 v{version}, 筛选等级 {args.level}, Python {platform.python_version()}")
+    print(f"{'分类':<10} {'条数':>5} {'条/秒':>12} {'p50(us)':>9} {'p99(us)':>9} {'分配(B/条)':>11}")
+    for name, row in results.items():
+        print(
+            f"{name:<10} {row['messages']:>5} {row['msgs_per_sec']:>12,} "
+            f"{row['p50_us']:>9.2f} {row['p99_us']:>9.2f} {row['alloc_bytes']:>11}"
+        )
+
+    if args.update_baseline:
+        baseline = {
+            "corpus_version": version,
+            "python": platform.python_version(),
+            "level": args.level,
+            "results": results,
+        }
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"\n已写入基线 {BASELINE_FILE}")
+        return 0
+
+    if not os.path.exists(BASELINE_FILE):
+        print("\n没有基线文件, 使用 --update-baseline 生成")
+        return 0
+    with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("corpus_version") != version or baseline.get("level") != args.level:
+        print("\n基线的语料版本或筛选等级与本次不一致, 请用 --update-baseline 重新生成")
+        return 3
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n吞吐量下降超过 {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
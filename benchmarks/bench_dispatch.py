@@ -0,0 +1,129 @@
+"""消息分发开销对比：每个频道一个处理器 vs 单一入口字典分发
+
+用法: python benchmarks/bench_dispatch.py [--updates N]
+
+旧方式按 Telethon 1.30 的分发逻辑建模：每条更新依次经过所有处理器的过滤器
+(每个频道一个 chats 集合判断，外加命令处理器的正则匹配)。新方式为 ChannelRouter.dispatch。
+分别在 1、50、500 个监听频道下测量每条更新的平均分发耗时。
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from channel_router import ChannelRouter, peer_id_variants  # noqa: E402
+
+COMMAND_PATTERN = r"^/(set|set_and_save|help|status|clear)($|\s.*)"
+SOURCE_COUNTS = (1, 50, 500)
+
+
+class FakeEvent:
+    __slots__ = ("chat_id", "raw_text", "pattern_match")
+
+    def __init__(self, chat_id, raw_text):
+        self.chat_id = chat_id
+        self.raw_text = raw_text
+        self.pattern_match = None
+
+
+class PerChannelFilter:
+    """模拟 events.NewMessage(chats=channel_id) 的过滤过程"""
+
+    def __init__(self, channel_id):
+        self.chats = set(peer_id_variants(channel_id))
+
+    def filter(self, event):
+        return event if event.chat_id in self.chats else None
+
+
+class CommandFilter:
+    """模拟 events.NewMessage(pattern=...) 的过滤过程"""
+
+    def __init__(self, pattern):
+        self.match = re.compile(pattern).match
+
+    def filter(self, event):
+        match = self.match(event.raw_text or "")
+        if not match:
+            return None
+        event.pattern_match = match
+        return event
+
+
+async def noop(event):
+    pass
+
+
+async def legacy_dispatch(handlers, event):
+    """Telethon 对每条更新依次运行所有处理器的过滤器"""
+    for builder, callback in handlers:
+        if builder.filter(event) is not None:
+            await callback(event)
+
+
+def run(coro):
+    """处理器不会真正挂起，直接驱动协程，避免事件循环开销干扰测量"""
+    try:
+        coro.send(None)
+    except StopIteration:
+        pass
+
+
+def make_updates(source_ids, count, seed=42):
+    """生成更新序列：20%来自监听频道，其余来自其他聊天，少量为命令"""
+    rng = random.Random(seed)
+    updates = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.2:
+            chat_id = -(1000000000000 + rng.choice(source_ids))
+            text = "🪙CA地址: 7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU"
+        elif roll < 0.22:
+            chat_id = rng.randint(1, 10**9)
+            text = "/status"
+        else:
+            chat_id = -(1000000000000 + rng.randint(10**9, 2 * 10**9))
+            text = "大家好，今天市场行情不错，注意风险。"
+        updates.append(FakeEvent(chat_id, text))
+    return updates
+
+
+def measure(dispatch, updates):
+    start = time.perf_counter()
+    for event in updates:
+        run(dispatch(event))
+    return (time.perf_counter() - start) / len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'频道数':>6} {'旧方式(us/条)':>14} {'单一入口(us/条)':>16} {'加速比':>8}")
+    for count in SOURCE_COUNTS:
+        source_ids = list(range(1500000000, 1500000000 + count))
+        updates = make_updates(source_ids, args.updates)
+
+        handlers = [(CommandFilter(COMMAND_PATTERN), noop)]
+        handlers += [(PerChannelFilter(cid), noop) for cid in source_ids]
+
+        router = ChannelRouter(noop, COMMAND_PATTERN)
+        router.set_routes((cid, noop) for cid in source_ids)
+
+        legacy = measure(lambda e: legacy_dispatch(handlers, e), updates)
+        routed = measure(router.dispatch, updates)
+        print(
+            f"{count:>6} {legacy * 1e6:>14.2f} {routed * 1e6:>16.2f} {legacy / routed:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""解析器回归与吞吐对比
+
+用法: python benchmarks/bench_parser.py [--fuzz N] [--rounds N] [--trials N] [--min-speedup X]
+
+1. 对语料库、随机拼接的边界消息以及插入了干扰片段的模板信号逐条比较新旧解析结果,
+   任何差异都会打印并返回非0
+2. 在语料库上交替计时旧版实现与 signal_parser.parse_signal, 每个实现取各轮中最快的
+   一次, 输出吞吐量与加速比
+
+门槛按关闭日志的旧版计算, 只比较解析本身。旧版在 INFO 级别下对每个命中的模式都写一行
+日志, 线上就是这样运行的, "旧版+INFO日志(写入 os.devnull)"的加速比只作参考。
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from legacy_parser import legacy_parse, logger as legacy_logger  # noqa: E402
+from signal_parser import parse_signal  # noqa: E402
+
+CORPUS_FILE = os.path.join(ROOT, "benchmarks", "corpus", "signals_v2.json")
+
+# 随机拼接用的片段, 覆盖各模式的关键字、前缀符号、空白与取值
+FUZZ_FRAGMENTS = [
+    "CA", "CA地址", "🪙", "等级", "level", "Level", "Twiiter评分", "Twitter评分",
+    "推特评分", "📊", "分", "市值", "当前", "💰", "K", " K", "粉丝数", "🙎",
+    "followers", "Followers", ":", ": ", " :", " : ", "  ", "\n", " ", "\t",
+    "Good", "Bad", "normal", "EXCELLENT", "Unknown", "优秀", "123", "45", "０９",
+    "0x6982508145454ce325ddbe47a25d4ec3d2311933",
+    "7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU",
+    "abc", "DCA", "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghij", "levelevel",
+]
+
+# 插入到语料消息中的片段: 标准模板各行的关键字和完整行
+MUTATION_FRAGMENTS = [
+    "🪙CA地址: ", "等级: ", "📊Twiiter评分: ", "💰当前市值: ", "🙎粉丝数: ",
+    "🪙CA地址: dup\n", "等级: Unknown\n", "📊Twiiter评分: 1分\n", "💰当前市值: 2 K\n",
+    "🙎粉丝数: 3\n", "_", "５", "\r",
+]
+
+
+def load_corpus():
+    """读取版本化语料库, 合并全部分类"""
+    with open(CORPUS_FILE, "r", encoding="utf-8") as f:
+        categories = json.load(f)["categories"]
+    return [text for messages in categories.values() for text in messages]
+
+
+def fuzz_messages(count, seed=20240501):
+    """生成确定性的随机拼接消息, 用于覆盖模式优先级的边界情况"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        parts = rng.choices(FUZZ_FRAGMENTS, k=rng.randint(1, 16))
+        messages.append("".join(parts))
+    return messages
+
+
+def configure_legacy_logging(enabled):
+    """按 app.py 的日志格式把旧版日志写到 os.devnull, 或者完全关闭"""
+    legacy_logger.handlers.clear()
+    legacy_logger.propagate = False
+    legacy_logger.disabled = not enabled
+    if enabled:
+        handler = logging.StreamHandler(open(os.devnull, "w", encoding="utf-8"))
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+        legacy_logger.addHandler(handler)
+        legacy_logger.setLevel(logging.INFO)
+
+
+def mutated_messages(messages, count, seed=20240502):
+    """在语料消息的随机位置插入片段, 覆盖标准模板被打乱或前面出现重复关键字的情况"""
+    rng = random.Random(seed)
+    mutated = []
+    for _ in range(count):
+        chars = list(rng.choice(messages))
+        for _ in range(rng.randint(1, 4)):
+            position = rng.randint(0, len(chars))
+            chars.insert(position, rng.choice(FUZZ_FRAGMENTS + MUTATION_FRAGMENTS))
+        mutated.append("".join(chars))
+    return mutated
+
+
+def check_identical(messages):
+    """逐条比较新旧解析结果, 返回差异列表"""
+    mismatches = []
+    for text in messages:
+        expected = legacy_parse(text)
+        actual = parse_signal(text)
+        if expected != actual:
+            mismatches.append((text, expected, actual))
+    return mismatches
+
+
+def measure(func, messages, rounds):
+    """返回每秒处理的消息数"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in messages:
+            func(text)
+    elapsed = time.perf_counter() - start
+    return rounds * len(messages) / elapsed
+
+
+def best_rates(funcs, messages, rounds, trials):
+    """交替计时各实现 trials 轮, 返回每个实现最快一轮的吞吐量, 减少机器负载波动的影响"""
+    best = [0.0] * len(funcs)
+    for _ in range(trials):
+        for i, func in enumerate(funcs):
+            best[i] = max(best[i], measure(func, messages, rounds))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fuzz", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--trials", type=int, default=7)
+    parser.add_argument("--min-speedup", type=float, default=5.0)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    configure_legacy_logging(False)
+    mismatches = check_identical(
+        corpus + fuzz_messages(args.fuzz) + mutated_messages(corpus, args.fuzz)
+    )
+    print(
+        f"回归检查: 语料 {len(corpus)} 条 + 随机 {args.fuzz} 条 + 变形 {args.fuzz} 条, "
+        f"差异 {len(mismatches)} 条"
+    )
+    for text, expected, actual in mismatches[:10]:
+        print(f"  消息: {text!r}\n  旧版: {expected}\n  新版: {actual}")
+    if mismatches:
+        return 1
+
+    # 旧实现每次 re.search 都会经过 re 模块的缓存查找, 这里保持原样计时
+    re.purge()
+    new_rate, quiet_rate = best_rates(
+        (parse_signal, legacy_parse), corpus, args.rounds, args.trials
+    )
+    configure_legacy_logging(True)
+    (legacy_rate,) = best_rates((legacy_parse,), corpus, args.rounds, args.trials)
+
+    speedup = new_rate / quiet_rate
+    print(f"旧版(关闭日志): {quiet_rate:,.0f} 条/秒")
+    print(f"旧版(INFO日志): {legacy_rate:,.0f} 条/秒")
+    print(f"新版解析器:     {new_rate:,.0f} 条/秒")
+    print(
+        f"加速比: {speedup:.1f}x (要求 >= {args.min_speedup}x), "
+        f"含INFO日志时 {new_rate / legacy_rate:.1f}x (仅供参考)"
+    )
+    return 0 if speedup >= args.min_speedup else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
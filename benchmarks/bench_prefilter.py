@@ -0,0 +1,149 @@
+"""预筛选的单次判断耗时
+
+用法: python benchmarks/bench_prefilter.py [--rounds N] [--trials N]
+
+按语料分类(signal_zh / signal_en / noise / edge)以及两类常见的闲聊消息(约150字的中文、
+约450字的英文)和带文字链接的消息, 测量 PreFilter 每次判断的平均耗时, 并与逐位置用
+正则查找裸地址的旧检查对比。新旧检查交替计时, 每组取 --trials 次中最快的一次。运行前先确认默认配置下, 长度上限以内的语料中解析器能解析
+出结果的消息都能通过预筛选。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telethon.tl.types import MessageEntityTextUrl  # noqa: E402
+
+from prefilter import PreFilter  # noqa: E402
+from signal_parser import _raw_ca_search, parse_signal  # noqa: E402
+
+CORPUS_FILE = os.path.join(ROOT, "benchmarks", "corpus", "signals_v2.json")
+
+CHATTER_ZH = ("今天市场整体情绪不错，大家注意控制仓位，不要追高，理性参与，有问题在群里讨论。" * 5)[:150]
+CHATTER_EN = (
+    "Market looks strong today, remember to size your positions and never chase green candles. "
+    * 6
+)[:450]
+LINK_TEXT = "新币上线，点这里查看合约"
+LINK_URL = "https://solscan.io/token/7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU"
+
+
+class FakeMessage:
+    __slots__ = ("message", "entities")
+
+    def __init__(self, message, entities=None):
+        self.message = message
+        self.entities = entities
+
+
+class FakeEvent:
+    __slots__ = ("message",)
+
+    def __init__(self, message, entities=None):
+        self.message = FakeMessage(message, entities)
+
+    @property
+    def raw_text(self):
+        return self.message.message
+
+
+class LegacyPreFilter(PreFilter):
+    """旧检查: 读取 raw_text, 标记查找后, 40字以上的文本逐位置用正则查找裸地址"""
+
+    def __call__(self, event) -> bool:
+        text = event.raw_text
+        if not text:
+            self.rejected_empty += 1
+            return False
+        if text[0] == "/":
+            self.passed += 1
+            return True
+        for marker in self.markers:
+            if marker in text:
+                self.passed += 1
+                return True
+        if self.raw_address and len(text) >= 40 and _raw_ca_search(text) is not None:
+            self.passed += 1
+            return True
+        self.rejected_no_marker += 1
+        return False
+
+
+def load_groups():
+    with open(CORPUS_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    groups = {name: [FakeEvent(text) for text in texts] for name, texts in data["categories"].items()}
+    groups["chatter_zh_150"] = [FakeEvent(CHATTER_ZH)]
+    groups["chatter_en_450"] = [FakeEvent(CHATTER_EN)]
+    groups["text_link"] = [
+        FakeEvent(LINK_TEXT, [MessageEntityTextUrl(offset=0, length=len(LINK_TEXT), url=LINK_URL)])
+    ]
+    return data["version"], groups
+
+
+def check_no_false_rejects(prefilter, groups):
+    """长度上限以内、解析器能解析出结果的消息都必须通过"""
+    failures = []
+    for name, events in groups.items():
+        for event in events:
+            message = event.message
+            text = message.message
+            if message.entities:
+                text = "\n".join([text, *(e.url for e in message.entities)])
+            if len(text) > prefilter.raw_address_max_length:
+                continue
+            if parse_signal(text) is not None and not prefilter(event):
+                failures.append((name, text[:60]))
+    return failures
+
+
+def per_call_us(check, events, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for event in events:
+            check(event)
+    return (time.perf_counter() - start) / (rounds * len(events)) * 1e6
+
+
+def best_us(checks, events, rounds, trials):
+    """交替计时各个检查, 返回每个检查最快一次的单次耗时"""
+    best = [float("inf")] * len(checks)
+    for _ in range(trials):
+        for index, check in enumerate(checks):
+            best[index] = min(best[index], per_call_us(check, events, rounds))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--trials", type=int, default=7)
+    args = parser.parse_args()
+
+    version, groups = load_groups()
+    prefilter = PreFilter()
+    legacy_prefilter = LegacyPreFilter()
+
+    failures = check_no_false_rejects(prefilter, groups)
+    if failures:
+        for name, text in failures:
+            print(f"误拒绝 [{name}]: {text}")
+        return 1
+
+    print(f"语料版本 {version}，每组 {args.rounds} 轮，取 {args.trials} 次中最快的一次")
+    print(f"{'分类':<16} {'旧检查(us)':>10} {'预筛选(us)':>10}")
+    for name, events in groups.items():
+        legacy, current = best_us(
+            (legacy_prefilter, prefilter), events, args.rounds, args.trials
+        )
+        print(f"{name:<16} {legacy:>10.2f} {current:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
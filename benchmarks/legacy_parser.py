@@ -0,0 +1,132 @@
+"""旧版解析实现, 仅作为回归与吞吐对照使用, 不要在机器人中引用"""
+
+import logging
+import re
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("VVVVVVVVVbot.legacy")
+
+
+def legacy_parse(message_text: str) -> Optional[Dict[str, Any]]:
+    """旧版 VVVVVVVVVBot.parse_VVVVVVVVV_message 的原样拷贝(含逐模式日志)"""
+    try:
+        # 打印原始消息文本，用于调试
+        logger.info(
+            f"开始解析消息: {message_text[:200]}..."
+        )  # 限制长度避免日志过大
+
+        # 尝试多种CA地址匹配模式
+        ca_patterns = [
+            r"🪙CA地址: ([^\s]+)",
+            r"🪙\s*CA地址\s*:\s*([^\s]+)",
+            r"CA地址\s*:\s*([^\s]+)",
+            r"CA地址:\s*([^\s]+)",
+            r"CA\s*:\s*([^\s]+)",
+            r"CA:([^\s]+)",
+            r"([a-zA-Z0-9]{40,42})",  # 尝试直接匹配CA地址格式
+        ]
+
+        ca_address = None
+        for pattern in ca_patterns:
+            ca_match = re.search(pattern, message_text)
+            if ca_match:
+                ca_address = ca_match.group(1)
+                logger.info(f"匹配到CA地址: {ca_address}，使用模式: {pattern}")
+                break
+
+        if not ca_address:
+            logger.info("未能匹配到CA地址")
+            return None
+
+        # 尝试多种等级匹配模式
+        level_patterns = [
+            r"等级: (\w+)",
+            r"等级\s*:\s*(\w+)",
+            r"level\s*:\s*(\w+)",
+            r"Level\s*:\s*(\w+)",
+        ]
+
+        level = "Unknown"
+        for pattern in level_patterns:
+            level_match = re.search(pattern, message_text)
+            if level_match:
+                level = level_match.group(1)
+                logger.info(f"匹配到等级: {level}，使用模式: {pattern}")
+                break
+
+        # 如果没有找到明确的等级，尝试从消息内容推断
+        if level == "Unknown":
+            if "excellent" in message_text.lower():
+                level = "Excellent"
+            elif "good" in message_text.lower():
+                level = "Good"
+            elif "normal" in message_text.lower():
+                level = "Normal"
+            elif "bad" in message_text.lower():
+                level = "Bad"
+            logger.info(f"从消息内容推断等级: {level}")
+
+        # 提取其他可能需要的信息
+        twitter_score_patterns = [
+            r"📊Twiiter评分: (\d+)分",
+            r"Twiiter评分: (\d+)",
+            r"Twitter评分: (\d+)",
+            r"推特评分: (\d+)",
+        ]
+
+        twitter_score = 0
+        for pattern in twitter_score_patterns:
+            twitter_score_match = re.search(pattern, message_text)
+            if twitter_score_match:
+                twitter_score = int(twitter_score_match.group(1))
+                logger.info(
+                    f"匹配到Twitter评分: {twitter_score}，使用模式: {pattern}"
+                )
+                break
+
+        market_value_patterns = [
+            r"💰当前市值: (\d+)\s*K",
+            r"当前市值: (\d+)",
+            r"市值: (\d+)",
+        ]
+
+        current_market_value = 0
+        for pattern in market_value_patterns:
+            market_match = re.search(pattern, message_text)
+            if market_match:
+                current_market_value = int(market_match.group(1))
+                logger.info(
+                    f"匹配到当前市值: {current_market_value}，使用模式: {pattern}"
+                )
+                break
+
+        followers_patterns = [
+            r"🙎粉丝数: (\d+)",
+            r"粉丝数: (\d+)",
+            r"followers: (\d+)",
+            r"Followers: (\d+)",
+        ]
+
+        followers = 0
+        for pattern in followers_patterns:
+            followers_match = re.search(pattern, message_text)
+            if followers_match:
+                followers = int(followers_match.group(1))
+                logger.info(f"匹配到粉丝数: {followers}，使用模式: {pattern}")
+                break
+
+        # 返回提取的信息
+        result = {
+            "ca_address": ca_address,
+            "level": level,
+            "twitter_score": twitter_score,
+            "current_market_value": current_market_value,
+            "followers": followers,
+            "raw_message": message_text,
+        }
+
+        logger.info(f"解析结果: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"解析消息失败: {e}")
+        return None
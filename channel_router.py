@@ -0,0 +1,83 @@
+"""单一消息入口：按聊天ID把更新分发到各频道的处理流程"""
+
+import re
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+Handler = Callable[[object], Awaitable[None]]
+
+# 与 Telethon 的标记ID规则一致: 频道 -100xxxxxxxxxx，普通群 -xxxx，用户 xxxx
+_CHANNEL_ID_OFFSET = 1000000000000
+
+
+def peer_id_variants(chat_id: int):
+    """返回配置中的聊天ID可能对应的全部标记ID
+
+    负数已经是带标记的ID；正数可能是用户、普通群或频道，与 Telethon 的 chats= 过滤器
+    处理方式相同，三种都登记。
+    """
+    if chat_id < 0:
+        return (chat_id,)
+    return (chat_id, -chat_id, -(_CHANNEL_ID_OFFSET + chat_id))
+
+
+class ChannelRouter:
+    """所有消息只注册一个处理器，通过字典查找分发
+
+    每条更新只做一次 chat_id 的字典查找，监听的频道数量不影响单条更新的开销。
+    不属于任何监听频道、且以"/"开头的消息才会匹配命令正则。
+    """
+
+    def __init__(
+        self,
+        command_handler: Optional[Handler] = None,
+        command_pattern: Optional[str] = None,
+    ):
+        self._routes: Dict[int, Handler] = {}
+        self.command_handler = command_handler
+        self._command_match = (
+            re.compile(command_pattern).match if command_pattern else None
+        )
+
+        self.routed = 0
+        self.commands = 0
+        self.ignored = 0
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._routes
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def add(self, chat_id: int, handler: Handler):
+        """为一个频道登记处理流程"""
+        for peer_id in peer_id_variants(chat_id):
+            self._routes[peer_id] = handler
+
+    def set_routes(self, routes: Iterable):
+        """用 (频道ID, 处理流程) 列表整体替换路由表"""
+        new_routes: Dict[int, Handler] = {}
+        for chat_id, handler in routes:
+            for peer_id in peer_id_variants(chat_id):
+                new_routes[peer_id] = handler
+        # 整体替换引用，分发过程中不会看到更新一半的路由表
+        self._routes = new_routes
+
+    async def dispatch(self, event):
+        """Telethon 的事件处理入口"""
+        handler = self._routes.get(event.chat_id)
+        if handler is not None:
+            self.routed += 1
+            await handler(event)
+            return
+
+        if self._command_match is not None:
+            text = event.raw_text
+            if text and text[0] == "/":
+                match = self._command_match(text)
+                if match:
+                    self.commands += 1
+                    event.pattern_match = match
+                    await self.command_handler(event)
+                    return
+
+        self.ignored += 1
@@ -0,0 +1,220 @@
+"""多实例部署时的CA认领：同一个CA只由一个实例转发"""
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+
+class ForwardClaims:
+    """基于 ca_claims 表的认领协议
+
+    转发前用一条 INSERT ... ON CONFLICT DO UPDATE ... WHERE ... RETURNING 认领CA，
+    一次往返即可知道是否抢到：不存在的CA直接插入，已存在的只有在认领过期后才能被接管。
+    认领带有租约 (lease 秒)，持有者在转发期间每隔三分之一租约续期一次，转发完成后把
+    过期时间延长到保留期，转发全部失败时删除认领；持有者宕机后不再续期，认领到期后
+    其他实例可以接管。
+
+    没抢到认领的实例在租约到期后尝试接管；原持有者仍在续期时继续等待，已完成时不会
+    再次转发。
+    """
+
+    def __init__(
+        self,
+        pool,
+        owner: str,
+        lease: float = 30.0,
+        retention: Optional[float] = None,
+    ):
+        self.pool = pool
+        self.owner = owner
+        self.lease = timedelta(seconds=lease)
+        # 完成后的认领保留多久，None 表示永久（与去重有效期一致）
+        self.retention = timedelta(seconds=retention) if retention else None
+
+        # 后台写入认领结果的任务，等待接管的任务，以及转发期间续期租约的任务
+        self._pending: Set[asyncio.Task] = set()
+        self._watchers: Set[asyncio.Task] = set()
+        self._renewals: Dict[str, asyncio.Task] = {}
+
+        self.claimed = 0
+        self.lost = 0
+        self.takeovers = 0
+        self.renewals = 0
+        self.errors = 0
+
+    async def start(self):
+        """建表"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ca_claims (
+                    ca_address TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    claimed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    expires_at TIMESTAMPTZ NOT NULL,
+                    completed BOOLEAN NOT NULL DEFAULT false
+                )
+                """
+            )
+        logger.info(f"多实例CA认领已启用，实例标识: {self.owner}")
+
+    async def claim(self, ca_address: str) -> bool:
+        """尝试认领CA，抢到返回True；数据库出错时按抢到处理，宁可重复也不漏发"""
+        claimed = await self._try_claim(ca_address)
+        if claimed:
+            self._hold(ca_address)
+        return True if claimed is None else claimed
+
+    async def _try_claim(self, ca_address: str) -> Optional[bool]:
+        """一次往返完成认领，数据库出错时返回None"""
+        try:
+            async with self.pool.acquire() as conn:
+                owner = await conn.fetchval(
+                    """
+                    INSERT INTO ca_claims (ca_address, owner, expires_at)
+                    VALUES ($1, $2, now() + $3::interval)
+                    ON CONFLICT (ca_address) DO UPDATE
+                    SET owner = EXCLUDED.owner,
+                        claimed_at = now(),
+                        expires_at = EXCLUDED.expires_at,
+                        completed = false
+                    WHERE ca_claims.expires_at < now()
+                    RETURNING owner
+                    """,
+                    ca_address,
+                    self.owner,
+                    self.lease,
+                )
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"认领CA地址 {ca_address} 时数据库出错: {e}")
+            return None
+
+        if owner is None:
+            self.lost += 1
+            return False
+        self.claimed += 1
+        return True
+
+    def _hold(self, ca_address: str):
+        """转发期间在后台续期租约，直到 finish"""
+        if ca_address not in self._renewals:
+            self._renewals[ca_address] = asyncio.create_task(self._renew(ca_address))
+
+    async def _renew(self, ca_address: str):
+        interval = self.lease.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self.pool.acquire() as conn:
+                    renewed = await conn.fetchval(
+                        """
+                        UPDATE ca_claims SET expires_at = now() + $3::interval
+                        WHERE ca_address = $1 AND owner = $2 AND NOT completed
+                        RETURNING true
+                        """,
+                        ca_address,
+                        self.owner,
+                        self.lease,
+                    )
+            except Exception as e:
+                # 数据库暂时不可用时下次再试，租约还没到期
+                self.errors += 1
+                logger.error(f"续期CA地址 {ca_address} 的认领失败: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"CA地址 {ca_address} 的认领已不属于本实例，停止续期")
+                return
+            self.renewals += 1
+
+    def finish(self, ca_address: str, forwarded: bool):
+        """在后台记录转发结果：成功时标记完成，全部失败时释放认领"""
+        renewal = self._renewals.pop(ca_address, None)
+        if renewal is not None:
+            renewal.cancel()
+        self._spawn(self._pending, self._finish(ca_address, forwarded))
+
+    async def _finish(self, ca_address: str, forwarded: bool):
+        try:
+            async with self.pool.acquire() as conn:
+                if forwarded:
+                    await conn.execute(
+                        """
+                        UPDATE ca_claims
+                        SET completed = true,
+                            expires_at = COALESCE(now() + $3::interval, 'infinity')
+                        WHERE ca_address = $1 AND owner = $2
+                        """,
+                        ca_address,
+                        self.owner,
+                        self.retention,
+                    )
+                else:
+                    await conn.execute(
+                        "DELETE FROM ca_claims WHERE ca_address = $1 AND owner = $2 AND NOT completed",
+                        ca_address,
+                        self.owner,
+                    )
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"更新CA地址 {ca_address} 的认领状态失败: {e}")
+
+    def watch(self, ca_address: str, forward: Callable[[], Awaitable[None]]):
+        """没抢到认领时，在租约到期后再尝试接管一次"""
+        self._spawn(self._watchers, self._watch(ca_address, forward))
+
+    async def _watch(self, ca_address: str, forward: Callable[[], Awaitable[None]]):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() + 1)
+            claimed = await self._try_claim(ca_address)
+            if claimed:
+                self.takeovers += 1
+                self._hold(ca_address)
+                logger.warning(f"CA地址 {ca_address} 的认领已过期，由本实例接管转发")
+                await forward()
+                return
+            # 数据库出错或原持有者已完成时放弃；仍在续期说明原持有者还在转发，继续等待
+            if claimed is None or await self._completed(ca_address) is not False:
+                return
+
+    async def _completed(self, ca_address: str) -> Optional[bool]:
+        """认领是否已完成；认领已被删除时返回False，数据库出错时返回None"""
+        try:
+            async with self.pool.acquire() as conn:
+                completed = await conn.fetchval(
+                    "SELECT completed FROM ca_claims WHERE ca_address = $1",
+                    ca_address,
+                )
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"查询CA地址 {ca_address} 的认领状态失败: {e}")
+            return None
+        return bool(completed)
+
+    @staticmethod
+    def _spawn(tasks: Set[asyncio.Task], coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def close(self):
+        """取消等待中的接管任务和续期任务，写完已有的转发结果"""
+        for task in list(self._watchers) + list(self._renewals.values()):
+            task.cancel()
+        self._renewals.clear()
+        tasks = self._pending | self._watchers
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "claimed": self.claimed,
+            "lost": self.lost,
+            "takeovers": self.takeovers,
+            "renewals": self.renewals,
+            "errors": self.errors,
+            "watching": len(self._watchers),
+        }
@@ -0,0 +1,107 @@
+"""从配置文件读取环境变量覆盖值，文件变化时在运行中重新应用"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# 可以在运行中修改的配置项（load_env_config 中的键），其余修改需要重启
+RELOADABLE_KEYS = (
+    "admin_ids",
+    "source_channel_ids",
+    "target_chat_ids",
+    "target_levels",
+    "target_rules",
+    "max_memory_addresses",
+    "log_detail_sample_rate",
+)
+
+
+def read_env_file(path: str) -> Dict[str, str]:
+    """读取 KEY=VALUE 格式的配置文件（与 .env 相同），忽略空行和 # 注释"""
+    values: Dict[str, str] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("export "):
+                line = line[len("export ") :].lstrip()
+            key, sep, value = line.partition("=")
+            key = key.strip()
+            if not sep or not key:
+                raise ValueError(f"{path} 第 {line_no} 行格式无效: {line}")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            values[key] = value
+    return values
+
+
+class ConfigWatcher:
+    """定期检查配置文件的修改时间和大小，变化后读取并交给 apply 应用
+
+    只用 stat 判断是否变化，文件不变时不读取内容；读取在线程中进行，不阻塞事件循环。
+    文件被删除时保持当前配置。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        apply: Callable[[Dict[str, str]], Awaitable[None]],
+        interval: float = 5.0,
+    ):
+        self.path = path
+        self.apply = apply
+        self.interval = interval
+        self._signature: Optional[Tuple[float, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.reloads = 0
+        self.errors = 0
+
+    def _stat(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def read(self) -> Dict[str, str]:
+        """同步读取当前配置文件（启动时使用），并记录文件状态，文件不存在时返回空"""
+        self._signature = self._stat()
+        if self._signature is None:
+            return {}
+        return read_env_file(self.path)
+
+    def start(self):
+        self._task = asyncio.create_task(self._watch_loop())
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                continue
+            self._signature = signature
+            await self.reload()
+
+    async def reload(self):
+        """读取配置文件并应用"""
+        try:
+            values = await asyncio.to_thread(read_env_file, self.path)
+            await self.apply(values)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"重新加载配置文件 {self.path} 失败: {e}")
+            return
+        self.reloads += 1
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {"reloads": self.reloads, "errors": self.errors}
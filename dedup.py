@@ -0,0 +1,313 @@
+"""CA地址去重存储"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Hashable, Optional
+
+from persistence import flush_loop
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+
+class DedupStore:
+    """按插入/访问顺序淘汰的去重存储，支持可选的过期时间
+
+    基于 OrderedDict，查找、插入和淘汰最久未出现的记录都是 O(1)。
+    ttl 从首次记录时开始计算，过期后同一个CA可以再次转发；命中只刷新淘汰顺序，
+    不会延长过期时间。
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if capacity <= 0:
+            raise ValueError(f"capacity必须大于0: {capacity}")
+        self.capacity = capacity
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """只查询不记录，过期的记录视为不存在"""
+        added_at = self._entries.get(key)
+        if added_at is None:
+            return False
+        return self.ttl is None or self._clock() - added_at < self.ttl
+
+    def seen(self, key: Hashable) -> bool:
+        """检查并记录key，已在有效期内出现过返回True，否则记录后返回False"""
+        entries = self._entries
+        now = self._clock()
+        added_at = entries.get(key)
+
+        if added_at is not None:
+            if self.ttl is None or now - added_at < self.ttl:
+                entries.move_to_end(key)
+                self.hits += 1
+                return True
+            # 已过期，按新记录处理
+            del entries[key]
+            self.expirations += 1
+
+        self.misses += 1
+        entries[key] = now
+        self._evict(now)
+        return False
+
+    def _evict(self, now: float):
+        """先清理队首已过期的记录，再按容量淘汰最久未出现的记录"""
+        entries = self._entries
+        if self.ttl is not None:
+            while entries:
+                key, added_at = next(iter(entries.items()))
+                if now - added_at < self.ttl:
+                    break
+                del entries[key]
+                self.expirations += 1
+
+        while len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, capacity: int):
+        """调整容量，缩小时立即淘汰多出的记录"""
+        if capacity <= 0:
+            raise ValueError(f"capacity必须大于0: {capacity}")
+        self.capacity = capacity
+        self._evict(self._clock())
+
+    def clear(self) -> int:
+        """清空所有记录，返回清除的数量"""
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中/未命中/淘汰/过期计数"""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class BloomFilter:
+    """布隆过滤器：判断"一定不存在"或"可能存在"
+
+    使用 blake2b 摘要做双重哈希，位数组大小和哈希次数由预期数量和误判率计算，
+    100万条、0.1%误判率约占用1.8MB内存。
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        if capacity <= 0:
+            raise ValueError(f"capacity必须大于0: {capacity}")
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate必须在0和1之间: {error_rate}")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(
+            8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str):
+        """加入key"""
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._bits)
+
+
+class PersistentDedupStore:
+    """保存在 processed_ca 表中的去重记录，前面挡一层布隆过滤器
+
+    启动时把表中的CA全部装入布隆过滤器。之后过滤器判断"一定不存在"的地址直接视为新地址，
+    只有"可能存在"时才查询数据库。新地址先放入待写缓冲区，由后台任务按数量或时间批量写入。
+    """
+
+    def __init__(
+        self,
+        pool,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.001,
+        ttl: Optional[float] = None,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        self.pool = pool
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.bloom = BloomFilter(capacity, error_rate)
+
+        self._pending: Dict[str, datetime] = {}
+        self._flush_event = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.loaded = 0
+        self.db_lookups = 0
+        self.db_hits = 0
+        self.written = 0
+
+    async def start(self):
+        """建表、装载已有记录并启动后台批量写入任务"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS processed_ca (
+                    ca_address TEXT PRIMARY KEY,
+                    first_seen TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+
+            query = "SELECT ca_address FROM processed_ca"
+            args = []
+            if self.ttl is not None:
+                query += " WHERE first_seen > now() - $1::interval"
+                args.append(timedelta(seconds=self.ttl))
+
+            async with conn.transaction():
+                async for record in conn.cursor(query, *args, prefetch=10000):
+                    self.bloom.add(record["ca_address"])
+                    self.loaded += 1
+
+        if self.loaded > self.bloom.capacity:
+            logger.warning(
+                f"processed_ca 记录数 {self.loaded} 超过布隆过滤器容量 {self.bloom.capacity}，"
+                f"误判率会升高，请调大 DEDUP_BLOOM_CAPACITY"
+            )
+        logger.info(
+            f"已从数据库装载 {self.loaded} 条CA去重记录，"
+            f"布隆过滤器占用 {self.bloom.size_bytes / 1024 / 1024:.1f}MB"
+        )
+
+        self._flush_task = asyncio.create_task(
+            flush_loop(self._flush_event, self.flush_interval, self.flush)
+        )
+
+    async def seen(self, key: str) -> bool:
+        """检查并记录key，已处理过返回True，否则加入待写缓冲区后返回False"""
+        if key not in self.bloom:
+            self._record(key)
+            return False
+
+        if key in self._pending:
+            return True
+
+        # 过滤器判断可能存在，查询数据库确认
+        self.db_lookups += 1
+        try:
+            async with self.pool.acquire() as conn:
+                first_seen = await conn.fetchval(
+                    "SELECT first_seen FROM processed_ca WHERE ca_address = $1", key
+                )
+        except Exception as e:
+            logger.error(f"查询CA去重记录失败: {e}")
+            return False
+
+        if first_seen is not None and (
+            self.ttl is None
+            or datetime.now(timezone.utc) - first_seen < timedelta(seconds=self.ttl)
+        ):
+            self.db_hits += 1
+            return True
+
+        self._record(key)
+        return False
+
+    def _record(self, key: str):
+        self.bloom.add(key)
+        self._pending[key] = datetime.now(timezone.utc)
+        if len(self._pending) >= self.batch_size:
+            self._flush_event.set()
+
+    async def flush(self):
+        """把待写缓冲区一次性写入数据库，失败时保留下次重试"""
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = {}
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO processed_ca (ca_address, first_seen)
+                    SELECT * FROM unnest($1::text[], $2::timestamptz[])
+                    ON CONFLICT (ca_address) DO UPDATE
+                    SET first_seen = EXCLUDED.first_seen
+                    """,
+                    list(batch.keys()),
+                    list(batch.values()),
+                )
+            self.written += len(batch)
+        except asyncio.CancelledError:
+            batch.update(self._pending)
+            self._pending = batch
+            raise
+        except Exception as e:
+            logger.error(f"批量写入CA去重记录失败，{len(batch)} 条将在下次重试: {e}")
+            batch.update(self._pending)
+            self._pending = batch
+
+    async def close(self):
+        """停止后台任务并写入剩余记录"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """返回装载/查库/写入计数"""
+        return {
+            "loaded": self.loaded,
+            "bloom_items": self.bloom.count,
+            "bloom_bytes": self.bloom.size_bytes,
+            "db_lookups": self.db_lookups,
+            "db_hits": self.db_hits,
+            "pending": len(self._pending),
+            "written": self.written,
+        }
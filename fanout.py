@@ -0,0 +1,307 @@
+"""向多个目标并发发送消息，按目标限速"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+
+class _PriorityWaiters:
+    """按优先级排队的等待者，带老化
+
+    排序键是"虚拟到达时间" = 到达时间 - 优先级 * aging：高一级相当于提前 aging 秒到达，
+    低优先级的等待者等得足够久之后会排到新到的高优先级前面，不会被饿死。
+    """
+
+    def __init__(self, aging: float, clock: Callable[[], float]):
+        self.aging = aging
+        self._clock = clock
+        self._heap: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def __bool__(self) -> bool:
+        return bool(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, priority: float) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        key = self._clock() - priority * self.aging
+        heapq.heappush(self._heap, (key, next(self._seq), future))
+        return future
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """取出排在最前、仍在等待的等待者"""
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                return future
+        return None
+
+
+class TokenBucket:
+    """令牌桶限速器，支持按 FloodWait 提示暂停
+
+    令牌不够时等待者按优先级（带老化）排队，有令牌时先发给排在最前的等待者。
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        clock: Callable[[], float] = time.monotonic,
+        aging: float = 5.0,
+    ):
+        if rate <= 0:
+            raise ValueError(f"rate必须大于0: {rate}")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._waiters = _PriorityWaiters(aging, clock)
+        self._granter: Optional[asyncio.Task] = None
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float):
+        """修改发放速率，已经积累的令牌按原速率结算"""
+        if rate <= 0:
+            raise ValueError(f"rate必须大于0: {rate}")
+        self._refill(self._clock())
+        self.rate = rate
+
+    def pause(self, seconds: float):
+        """在接下来的seconds秒内不发放令牌"""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self._tokens = 0.0
+
+    @property
+    def paused_for(self) -> float:
+        """剩余暂停秒数"""
+        return max(0.0, self._paused_until - self._clock())
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: float = 0.0):
+        """等待并取走一个令牌，priority 越大越先拿到"""
+        now = self._clock()
+        if not self._waiters and now >= self._paused_until:
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+        future = self._waiters.push(priority)
+        if self._granter is None or self._granter.done():
+            self._granter = asyncio.create_task(self._grant_loop())
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已经拿到令牌后才被取消，把令牌还回去
+            if future.done() and not future.cancelled():
+                self._tokens += 1
+            raise
+
+    async def _grant_loop(self):
+        """按优先级顺序把令牌发给等待者，直到没有等待者"""
+        while self._waiters:
+            now = self._clock()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                future = self._waiters.pop()
+                if future is not None:
+                    self._tokens -= 1
+                    future.set_result(None)
+                continue
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PrioritySemaphore:
+    """按优先级（带老化）放行的信号量"""
+
+    def __init__(
+        self, value: int, aging: float = 5.0, clock: Callable[[], float] = time.monotonic
+    ):
+        self._value = value
+        self._waiters = _PriorityWaiters(aging, clock)
+
+    async def acquire(self, priority: float = 0.0):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = self._waiters.push(priority)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已经拿到名额后才被取消，把名额让给下一个
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        future = self._waiters.pop()
+        if future is None:
+            self._value += 1
+        else:
+            # 名额直接转交给排在最前的等待者
+            future.set_result(None)
+
+
+class TargetStats:
+    """单个目标的发送统计"""
+
+    __slots__ = (
+        "sent",
+        "failed",
+        "flood_waits",
+        "last_latency",
+        "total_latency",
+        "max_latency",
+    )
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float, ok: bool):
+        self.last_latency = latency
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    @property
+    def avg_latency(self) -> float:
+        total = self.sent + self.failed
+        return self.total_latency / total if total else 0.0
+
+
+class FanoutDispatcher:
+    """把一条消息并发发送给所有目标
+
+    每个目标有独立的令牌桶，整体并发数由信号量限制。目标返回 FloodWaitError 时，
+    按提示的秒数暂停该目标的令牌桶，其他目标不受影响；暂停结束后重新发送这条消息，
+    连续超过 flood_retries 次才按失败处理。
+
+    发送繁忙时，等待令牌和并发名额的消息按 priority 排队（高等级的信号先发），
+    低优先级每多等 aging 秒相当于提高一级，不会一直排在后面。
+    """
+
+    def __init__(
+        self,
+        send_func: Callable[[int, str], Awaitable[bool]],
+        max_concurrency: int = 10,
+        rate: float = 1.0,
+        burst: int = 3,
+        on_result: Optional[Callable[[int, float, bool], None]] = None,
+        aging: float = 5.0,
+        flood_retries: int = 3,
+    ):
+        self.send_func = send_func
+        # 每次发送结束后调用 on_result(目标, 耗时秒数, 是否成功)，用于导出指标
+        self.on_result = on_result
+        self.rate = rate
+        self.burst = burst
+        self.aging = aging
+        self.flood_retries = flood_retries
+        self._semaphore = PrioritySemaphore(max_concurrency, aging)
+        self._buckets: Dict[int, TokenBucket] = {}
+        self.stats: Dict[int, TargetStats] = {}
+        # 等待令牌/并发名额或正在进行的发送数
+        self.pending = 0
+
+    def set_rate(self, rate: float):
+        """修改每个目标的发送速率，已经创建的令牌桶同时生效"""
+        self.rate = rate
+        for bucket in self._buckets.values():
+            bucket.set_rate(rate)
+
+    def _bucket(self, target: int) -> TokenBucket:
+        bucket = self._buckets.get(target)
+        if bucket is None:
+            bucket = self._buckets[target] = TokenBucket(
+                self.rate, self.burst, aging=self.aging
+            )
+            self.stats[target] = TargetStats()
+        return bucket
+
+    async def dispatch(
+        self, targets: Iterable[int], message_text: str, priority: float = 0.0
+    ) -> Dict[int, bool]:
+        """并发发送到所有目标，返回每个目标是否发送成功"""
+        targets = list(targets)
+        results = await asyncio.gather(
+            *(self._send_one(target, message_text, priority) for target in targets)
+        )
+        return dict(zip(targets, results))
+
+    async def _send_one(self, target: int, message_text: str, priority: float) -> bool:
+        bucket = self._bucket(target)
+        stats = self.stats[target]
+
+        self.pending += 1
+        try:
+            flood_waits = 0
+            while True:
+                # 先等令牌再占并发名额，被限速的目标不会占住其他目标的发送槽位
+                await bucket.acquire(priority)
+                await self._semaphore.acquire(priority)
+                try:
+                    start = time.perf_counter()
+                    try:
+                        ok = bool(await self.send_func(target, message_text))
+                    except FloodWaitError as e:
+                        bucket.pause(e.seconds)
+                        stats.flood_waits += 1
+                        flood_waits += 1
+                        if flood_waits <= self.flood_retries:
+                            # 暂停结束后令牌桶才会发放令牌，届时重新发送
+                            logger.warning(
+                                f"目标 {target} 触发FloodWait，暂停 {e.seconds} 秒后重新发送"
+                            )
+                            continue
+                        logger.warning(f"目标 {target} 多次触发FloodWait，放弃发送")
+                        ok = False
+                    except Exception as e:
+                        logger.error(f"发送到 {target} 失败: {e}")
+                        ok = False
+                    latency = time.perf_counter() - start
+                finally:
+                    self._semaphore.release()
+                break
+        finally:
+            self.pending -= 1
+
+        stats.record(latency, ok)
+        if self.on_result is not None:
+            self.on_result(target, latency, ok)
+        if ok:
+            logger.debug("已发送到聊天 %s，耗时 %.0fms", target, latency * 1000)
+        return ok
+
+    def paused_for(self, target: int) -> Optional[float]:
+        """目标剩余的FloodWait暂停秒数"""
+        bucket = self._buckets.get(target)
+        return bucket.paused_for if bucket else None
@@ -0,0 +1,169 @@
+"""多字段筛选规则：把规则表达式编译成一个判断函数
+
+规则示例:
+    level >= Good and (twitter_score >= 60 or followers >= 10000)
+    not current_market_value > 500 and level != Bad
+
+字段: level, twitter_score, current_market_value (别名 market_value), followers
+比较: >= > <= < == !=，等级按 Bad < Normal < Good < Excellent 比较，未知等级最低
+组合: and, or, not 和括号
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from signal_parser import LEVEL_PRIORITY
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+# 规则中的字段名 -> 解析结果中的键
+_FIELDS = {
+    "level": "level",
+    "twitter_score": "twitter_score",
+    "current_market_value": "current_market_value",
+    "market_value": "current_market_value",
+    "followers": "followers",
+}
+_OPERATORS = (">=", "<=", "==", "!=", ">", "<")
+
+_TOKEN_RE = re.compile(r"\s*(>=|<=|==|!=|>|<|\(|\)|[A-Za-z_][A-Za-z0-9_]*|-?\d+)")
+
+
+class RuleError(ValueError):
+    """规则表达式无效"""
+
+
+def _tokenize(text: str) -> List[str]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise RuleError(f"无法识别的内容: {text[pos:].strip()[:20]}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降解析，输出只包含已校验字段、运算符和整数常量的Python表达式"""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise RuleError("规则不完整")
+        self.pos += 1
+        return token
+
+    def parse(self) -> str:
+        if not self.tokens:
+            raise RuleError("规则为空")
+        expr = self.parse_or()
+        if self.peek() is not None:
+            raise RuleError(f"多余的内容: {' '.join(self.tokens[self.pos:])}")
+        return expr
+
+    def parse_or(self) -> str:
+        parts = [self.parse_and()]
+        while self.peek() == "or":
+            self.take()
+            parts.append(self.parse_and())
+        return parts[0] if len(parts) == 1 else "(" + " or ".join(parts) + ")"
+
+    def parse_and(self) -> str:
+        parts = [self.parse_not()]
+        while self.peek() == "and":
+            self.take()
+            parts.append(self.parse_not())
+        return parts[0] if len(parts) == 1 else "(" + " and ".join(parts) + ")"
+
+    def parse_not(self) -> str:
+        if self.peek() == "not":
+            self.take()
+            return f"(not {self.parse_not()})"
+        if self.peek() == "(":
+            self.take()
+            expr = self.parse_or()
+            if self.take() != ")":
+                raise RuleError("缺少右括号")
+            return expr
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> str:
+        name = self.take()
+        key = _FIELDS.get(name)
+        if key is None:
+            raise RuleError(f"未知字段: {name}，可用字段: {', '.join(_FIELDS)}")
+        op = self.take()
+        if op not in _OPERATORS:
+            raise RuleError(f"{name} 后面需要比较运算符，而不是 {op}")
+        value = self.take()
+
+        if key == "level":
+            # 等级在编译时换成优先级数字，运行时只比较整数
+            if value not in LEVEL_PRIORITY:
+                raise RuleError(f"未知等级: {value}")
+            return f"(_level(d['level'], -1) {op} {LEVEL_PRIORITY[value]})"
+
+        if not re.fullmatch(r"-?\d+", value):
+            raise RuleError(f"{name} 需要与整数比较，而不是 {value}")
+        return f"(d['{key}'] {op} {int(value)})"
+
+
+class CompiledRule:
+    """编译后的规则，predicate(解析结果) 返回是否通过"""
+
+    __slots__ = ("source", "expression", "predicate")
+
+    def __init__(self, source: str, expression: str, predicate: Predicate):
+        self.source = source
+        self.expression = expression
+        self.predicate = predicate
+
+    def __call__(self, data: Dict[str, Any]) -> bool:
+        return self.predicate(data)
+
+    def __repr__(self):
+        return f"CompiledRule({self.source!r})"
+
+
+def compile_rule(source: str) -> CompiledRule:
+    """解析并编译规则，无效时抛出 RuleError"""
+    expression = _Parser(_tokenize(source)).parse()
+    # 表达式只由校验过的字段、运算符和整数拼成，编译为一个函数，运行时没有解释开销
+    code = compile(f"lambda d: {expression}", "<filter rule>", "eval")
+    predicate = eval(code, {"__builtins__": {}, "_level": LEVEL_PRIORITY.get})
+    return CompiledRule(" ".join(source.split()), expression, predicate)
+
+
+class RuleFilter:
+    """当前生效的规则，替换时整体更换引用，处理中的消息不会看到一半的规则"""
+
+    def __init__(self):
+        self.rule: Optional[CompiledRule] = None
+        self.passed = 0
+        self.rejected = 0
+
+    def set(self, source: Optional[str]) -> Optional[CompiledRule]:
+        """编译并启用规则，传入空值时关闭规则筛选；无效规则抛出 RuleError 且不影响当前规则"""
+        rule = compile_rule(source) if source and source.strip() else None
+        self.rule = rule
+        return rule
+
+    def __call__(self, data: Dict[str, Any]) -> bool:
+        rule = self.rule
+        if rule is None:
+            return True
+        if rule.predicate(data):
+            self.passed += 1
+            return True
+        self.rejected += 1
+        return False
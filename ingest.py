@@ -0,0 +1,144 @@
+"""有界的接收队列：更新处理器只负责入队，由多个工作协程完成解析、筛选、去重和发送"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# 队列满时的处理方式
+WHEN_FULL = ("drop_oldest", "drop_newest", "block")
+
+
+class IngestQueue:
+    """接收队列和工作协程
+
+    队列满时:
+    - drop_oldest: 丢弃队列中最早的消息，保留新消息（信号越新越有价值，默认）
+    - drop_newest: 丢弃新到的消息
+    - block: 等待队列有空位，压力传回更新处理器
+
+    每条消息记录入队时间，工作协程取出时通过 on_wait(排队秒数) 上报排队耗时；
+    每丢弃一条消息调用一次 on_drop()。
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[object], Awaitable[None]],
+        workers: int = 4,
+        maxsize: int = 10000,
+        when_full: str = "drop_oldest",
+        on_wait: Optional[Callable[[float], None]] = None,
+        on_drop: Optional[Callable[[], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if when_full not in WHEN_FULL:
+            raise ValueError(f"when_full 必须是 {', '.join(WHEN_FULL)} 之一: {when_full}")
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.when_full = when_full
+        self.on_wait = on_wait
+        self.on_drop = on_drop
+        self._clock = clock
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._tasks: List[asyncio.Task] = []
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.taken = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def oldest_wait(self) -> float:
+        """队列中最早的消息已经排队的秒数，队列为空时为0"""
+        # asyncio.Queue 的内部 deque，只读取队首
+        pending = self._queue._queue
+        if not pending:
+            return 0.0
+        return self._clock() - pending[0][0]
+
+    async def submit(self, event):
+        """放入一条消息，除 block 方式外不会等待"""
+        item = (self._clock(), event)
+        if self.when_full == "block":
+            await self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self._drop()
+                if self.when_full == "drop_newest":
+                    return
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._queue.put_nowait(item)
+
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def _drop(self):
+        self.dropped += 1
+        if self.on_drop is not None:
+            self.on_drop()
+        # 持续满载时不逐条打日志
+        if self.dropped % 100 == 1:
+            logger.warning(
+                f"接收队列已满（{self.maxsize} 条），按 {self.when_full} 方式丢弃消息，累计丢弃 {self.dropped} 条"
+            )
+
+    def start(self):
+        """启动工作协程"""
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        logger.info(f"接收队列已启动，{self.workers} 个工作协程，队列上限 {self.maxsize} 条")
+
+    async def _worker(self):
+        while True:
+            enqueued_at, event = await self._queue.get()
+            wait = self._clock() - enqueued_at
+            self.taken += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+            if self.on_wait is not None:
+                self.on_wait(wait)
+            try:
+                await self.handler(event)
+            except Exception as e:
+                logger.error(f"处理消息失败: {e}")
+            finally:
+                self.processed += 1
+                self._queue.task_done()
+
+    async def close(self, timeout: float = 5.0):
+        """等待队列中的消息处理完（最多 timeout 秒）后停止工作协程"""
+        if self._tasks and self._queue.qsize():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"停止时接收队列中还有 {self._queue.qsize()} 条消息未处理")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "oldest_wait": self.oldest_wait(),
+            "avg_wait": self.total_wait / self.taken if self.taken else 0.0,
+            "max_wait": self.max_wait,
+        }
@@ -0,0 +1,112 @@
+"""发送积压超过能力时自适应丢弃信号，积压消除后恢复"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from signal_parser import LEVEL_PRIORITY
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# 有效等级最高提高到 Excellent，Excellent 信号不会因为等级被丢弃
+_TOP_PRIORITY = max(LEVEL_PRIORITY.values())
+_LEVEL_NAMES = {priority: level for level, priority in LEVEL_PRIORITY.items()}
+
+
+class LoadShedder:
+    """根据发送积压调整的丢弃策略
+
+    backlog() 返回积压的条数（接收队列中的消息、等待中和进行中的发送），queue_wait()
+    返回接收队列中最早的消息已经排队的秒数。积压超过 high_water 或排队超过 high_wait
+    秒时每 step 秒把有效筛选等级在当前等级之上提高一级（最高到 Excellent），并丢弃
+    消息时间早于 max_age 秒的信号；积压低于 low_water 且排队不到 low_wait 秒后每 step
+    秒降低一级，直到回到当前设置的等级。状态只在处理消息时更新，没有后台任务。
+    """
+
+    def __init__(
+        self,
+        backlog: Callable[[], int],
+        high_water: int = 50,
+        low_water: int = 10,
+        queue_wait: Optional[Callable[[], float]] = None,
+        high_wait: float = 5.0,
+        low_wait: float = 1.0,
+        max_age: float = 60.0,
+        step: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.backlog = backlog
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self.queue_wait = queue_wait
+        self.high_wait = high_wait
+        self.low_wait = min(low_wait, high_wait)
+        self.max_age = max_age
+        self.step = step
+        self._clock = clock
+
+        # 在当前等级之上提高的级数，0 表示未在丢弃
+        self.boost = 0
+        self._changed_at = clock()
+
+        self.shed_too_old = 0
+        self.shed_level = 0
+        self.activations = 0
+        self.max_boost = 0
+
+    @property
+    def active(self) -> bool:
+        return self.boost > 0
+
+    def _update(self, backlog: int, wait: float, current_level: str):
+        now = self._clock()
+        if now - self._changed_at < self.step:
+            return
+        at_top = LEVEL_PRIORITY[self.effective_level(current_level)] == _TOP_PRIORITY
+        overloaded = backlog > self.high_water or wait > self.high_wait
+        if overloaded and not (self.boost and at_top):
+            if self.boost == 0:
+                self.activations += 1
+            self.boost += 1
+            self.max_boost = max(self.max_boost, self.boost)
+            self._changed_at = now
+            logger.warning(
+                f"发送积压 {backlog} 条（最早排队 {wait:.1f} 秒），自适应丢弃提高到 {self.boost} 级"
+            )
+        elif backlog < self.low_water and wait < self.low_wait and self.boost > 0:
+            self.boost -= 1
+            self._changed_at = now
+            if self.boost == 0:
+                logger.info(f"发送积压已降到 {backlog} 条，停止自适应丢弃")
+            else:
+                logger.info(f"发送积压降到 {backlog} 条，自适应丢弃降低到 {self.boost} 级")
+
+    def effective_level(self, current_level: str) -> str:
+        """当前等级提高 boost 级后的有效等级"""
+        base = -1 if current_level == "All" else LEVEL_PRIORITY.get(current_level, 1)
+        return _LEVEL_NAMES[min(base + self.boost, _TOP_PRIORITY)]
+
+    def check(self, level: str, message_date: datetime, current_level: str) -> Optional[str]:
+        """返回丢弃原因（too_old / level），不丢弃时返回None"""
+        wait = self.queue_wait() if self.queue_wait is not None else 0.0
+        self._update(self.backlog(), wait, current_level)
+        if not self.boost:
+            return None
+        if self.max_age and time.time() - message_date.timestamp() > self.max_age:
+            self.shed_too_old += 1
+            return "too_old"
+        floor = LEVEL_PRIORITY[self.effective_level(current_level)]
+        if LEVEL_PRIORITY.get(level, -1) < floor:
+            self.shed_level += 1
+            return "level"
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "boost": self.boost,
+            "max_boost": self.max_boost,
+            "activations": self.activations,
+            "shed_too_old": self.shed_too_old,
+            "shed_level": self.shed_level,
+        }
@@ -0,0 +1,74 @@
+"""日志配置：文件写入放到后台线程，按大小轮转"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """原样把日志记录放入队列，消息格式化推迟到后台线程
+
+    标准的 QueueHandler 会在调用线程里先格式化消息，这里只在同一进程的线程间传递，
+    不需要提前格式化。日志参数应当是不会再被修改的值。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging() -> QueueListener:
+    """配置根日志：事件循环线程只负责入队，后台线程写文件和控制台
+
+    通过环境变量调整:
+    LOG_LEVEL (默认 INFO)、LOG_FILE (默认 bot.log)、
+    LOG_MAX_BYTES (默认 10MB)、LOG_BACKUP_COUNT (默认 5)
+    """
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    log_file = os.environ.get("LOG_FILE", "bot.log")
+    max_bytes = int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    backup_count = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener.start()
+    # 退出时把队列中剩余的日志写完
+    atexit.register(listener.stop)
+    return listener
+
+
+class DetailSampler:
+    """按比例抽样逐条消息的调试日志
+
+    rate 为 0 时完全关闭；只有 DEBUG 级别开启时才会抽样，
+    调用方据此决定是否拼装详细日志。
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float):
+        self.logger = logger
+        self.rate = rate
+
+    def __call__(self) -> bool:
+        if self.rate <= 0 or not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        return self.rate >= 1 or random.random() < self.rate
@@ -1,41 +1,83 @@
-import re
 import os
 import sys
 import logging
 import asyncio
+import time
 from typing import Optional, List, Dict, Any, Set
 
 from telethon import TelegramClient, events
 from telethon.tl.types import User, PeerChannel, PeerChat, PeerUser
-from telethon.tl.functions.messages import GetHistoryRequest
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("bot.log", encoding="utf-8"),
-        logging.StreamHandler(),
-    ],
+from telethon.errors import (
+    ChannelInvalidError,
+    FloodWaitError,
+    PeerIdInvalidError,
 )
+from telethon.sessions import StringSession
+
+from backfill import Backfill, FileCheckpointStore
+from batcher import OutboundBatcher
+from channel_router import ChannelRouter
+from config_reload import RELOADABLE_KEYS, ConfigWatcher
+from dedup import DedupStore
+from fanout import FanoutDispatcher
+from filter_rules import CompiledRule, RuleError, RuleFilter
+from ingest import WHEN_FULL, IngestQueue
+from load_shedding import LoadShedder
+from log_setup import DetailSampler, setup_logging
+from metrics import BotMetrics, start_metrics_server
+from parse_cache import ParseCache
+from peer_cache import NameCache, FilePeerStore, PeerCache
+from prefilter import PreFilter
+from sender_pool import SenderPool
+from signal_parser import parse_signal, signal_priority
+from target_routes import TargetRouter, parse_target_levels, parse_target_rules
+
+# 配置日志（文件写入在后台线程中进行）
+setup_logging()
 logger = logging.getLogger("VVVVVVVVVbot")
 
 # 定义等级枚举
 LEVELS = ["Bad", "Normal", "Good", "Excellent", "All"]
 DEFAULT_LEVEL = "Normal"  # 默认等级
 
+# 管理命令
+COMMAND_PATTERN = r"^/(set|rule|help|status|clear)($|\s.*)"
+
 
 class VVVVVVVVVBot:
     def __init__(self):
+        # 启动时间，用于统计启动各阶段和首次转发的耗时
+        self.started_at = time.monotonic()
+        self.first_forward_seen = False
+        self.warmup_task = None
+
         # 当前设置的筛选等级
         self.current_level = DEFAULT_LEVEL
 
-        # 内存存储的历史提取记录
-        self.processed_ca_addresses = set()
-
         # 从环境变量中读取配置
         self.load_env_config()
 
+        # 在等级之外按多字段规则筛选，规则编译后整体替换
+        self.rule_filter = RuleFilter()
+        if self.config["filter_rule"]:
+            try:
+                self.rule_filter.set(self.config["filter_rule"])
+            except RuleError as e:
+                logger.error(f"FILTER_RULE 无效，已忽略: {e}")
+
+        # 按目标的等级和规则预先计算接收目标，等级或配置变化时重建
+        self.target_router = TargetRouter()
+        self.target_levels: Dict[int, str] = {}
+        self.target_rules: Dict[int, CompiledRule] = {}
+        self.load_target_filters()
+        self.rebuild_routes()
+
+        # 内存存储的历史提取记录，按最久未出现的顺序淘汰
+        self.processed_ca_addresses = DedupStore(
+            self.config["max_memory_addresses"],
+            ttl=self.config["dedup_ttl_seconds"],
+        )
+
         # 初始化Telegram客户端，使用文件作为session存储
         self.client = TelegramClient(
             # Use file-based session instead of StringSession
@@ -45,29 +87,197 @@ class VVVVVVVVVBot:
         )
         logger.info("正在使用文件session登录（用户模式）")
 
+        # 目标聊天的实体缓存，保存在本地文件中
+        self.peer_cache = PeerCache(FilePeerStore(self.config["peer_cache_file"]))
+
+        # 聊天/用户的显示名称，只用于日志和状态展示，在后台填充
+        self.names = NameCache()
+
+        # 可选：额外的发送账号与主账号一起分担发送，监听仍只用主账号
+        self.sender_pool = None
+        if self.config["sender_session_strings"]:
+            self.sender_pool = SenderPool(self.send_with)
+            self.sender_pool.add("main", self.client, self.peer_cache, owned=False)
+            for index, session in enumerate(self.config["sender_session_strings"], 1):
+                self.sender_pool.add(
+                    f"sender{index}",
+                    TelegramClient(
+                        StringSession(session),
+                        self.config["api_id"],
+                        self.config["api_hash"],
+                        # FloodWait 直接抛出，由账号池暂停该账号并换其他账号发送
+                        flood_sleep_threshold=0,
+                    ),
+                )
+
+        # 逐条消息的调试日志按比例抽样，默认关闭
+        self.log_detail = DetailSampler(logger, self.config["log_detail_sample_rate"])
+
+        # Prometheus 指标，通过 /metrics 接口导出
+        self.metrics = BotMetrics(LEVELS)
+        self.metrics_server = None
+
+        # 相同文本的消息（转发、重发）直接使用上次的解析结果
+        self.parse_cache = None
+        self.parse = self.parse_VVVVVVVVV_message
+        if self.config["parse_cache_size"] > 0:
+            self.parse_cache = ParseCache(
+                self.parse_VVVVVVVVV_message, self.config["parse_cache_size"]
+            )
+            self.parse = self.parse_cache
+
+        # 监听频道的消息先进入有界队列，由工作协程处理，慢速发送不阻塞接收
+        self.ingest = None
+        if self.config["ingest_workers"] > 0:
+            self.ingest = IngestQueue(
+                self.handle_VVVVVVVVV_message,
+                workers=self.config["ingest_workers"],
+                maxsize=self.config["ingest_queue_size"],
+                when_full=self.config["ingest_when_full"],
+                on_wait=self.metrics.ingest_wait.observe,
+                on_drop=self.metrics.ingest_dropped.inc,
+            )
+            self.metrics.ingest_depth.set_function(lambda: len(self.ingest))
+
+        # 转发在后台任务中进行，处理流程不等发送完成就处理下一条消息：积压的信号都进入
+        # 按优先级排队的发送流程，而不是按到达顺序留在接收队列里
+        self.forwards: Set[asyncio.Task] = set()
+        self.forward_slots = asyncio.Semaphore(self.config["forward_max_pending"])
+
+        # 并发、限速地向所有目标发送消息
+        self.fanout = FanoutDispatcher(
+            self.send_message_to_target,
+            max_concurrency=self.config["fanout_concurrency"],
+            rate=self.config["target_rate_per_second"],
+            burst=self.config["target_burst"],
+            on_result=self.metrics.observe_send,
+            aging=self.config["priority_aging_seconds"],
+        )
+
+        # 可选：发送繁忙时把短时间内的多个CA合并成一条消息
+        self.batcher = None
+        if self.config["outbound_batching"]:
+            self.batcher = OutboundBatcher(
+                self.fanout.dispatch,
+                window=self.config["batch_window_ms"] / 1000,
+                max_items=self.config["batch_max_items"],
+                aging=self.config["priority_aging_seconds"],
+            )
+
+        # 可选：发送积压超过能力时自适应提高等级、丢弃过时的信号
+        self.shedder = None
+        if self.config["shed_enabled"]:
+            self.shedder = LoadShedder(
+                self.outbound_backlog,
+                high_water=self.config["shed_high_water"],
+                low_water=self.config["shed_low_water"],
+                queue_wait=self.ingest.oldest_wait if self.ingest is not None else None,
+                high_wait=self.config["shed_high_wait_seconds"],
+                low_wait=self.config["shed_low_wait_seconds"],
+                max_age=self.config["shed_max_age_seconds"],
+                step=self.config["shed_step_seconds"],
+            )
+
+        # 监听频道的处理进度，用于补读错过的消息
+        self.backfill = None
+        if self.config["backfill_enabled"]:
+            self.backfill = Backfill(
+                self.client,
+                FileCheckpointStore(self.config["checkpoint_file"]),
+                self.handle_VVVVVVVVV_message,
+                max_age=self.config["backfill_max_age_seconds"],
+                concurrency=self.config["backfill_concurrency"],
+                max_messages=self.config["backfill_max_messages"],
+            )
+
+        # 在 NewMessage 事件层面预筛选，不含CA标记或地址的消息不进入处理流程
+        self.prefilter = None
+        if self.config["prefilter_enabled"]:
+            self.prefilter = PreFilter(
+                self.config["prefilter_markers"],
+                raw_address=self.config["prefilter_raw_address"],
+                raw_address_max_length=self.config["prefilter_raw_address_max_length"],
+            )
+            self.metrics.watch_prefilter(self.prefilter)
+
         # 注册事件处理器
         self.register_handlers()
 
     def load_env_config(self):
-        """从环境变量加载配置"""
-        self.config = {
+        """从环境变量加载配置，设置了 CONFIG_FILE 时以文件中的值为准"""
+        # 配置文件修改后，其中可热更新的配置在运行中重新应用
+        self.config_watcher = None
+        overrides: Dict[str, str] = {}
+        config_file = os.environ.get("CONFIG_FILE", "")
+        if config_file:
+            self.config_watcher = ConfigWatcher(
+                config_file,
+                self.reload_config,
+                interval=float(os.environ.get("CONFIG_RELOAD_INTERVAL", "5")),
+            )
+            try:
+                overrides = self.config_watcher.read()
+            except (OSError, ValueError) as e:
+                logger.error(f"读取配置文件 {config_file} 失败，只使用环境变量: {e}")
+        self.config = self.build_config({**os.environ, **overrides})
+
+        # 验证必要配置是否存在
+        missing_configs = []
+        for key in [
+            "api_id",
+            "api_hash",
+        ]:  # Remove session_string from required configs
+            if not self.config.get(key):
+                missing_configs.append(key)
+
+        if missing_configs:
+            logger.error(f"缺少必要的环境变量: {', '.join(missing_configs)}")
+            sys.exit(1)
+
+        # 验证列表配置
+        if not self.config["admin_ids"]:
+            logger.warning("未配置管理员ID，某些功能可能无法使用")
+
+        if not self.config["source_channel_ids"]:
+            logger.error("未配置源频道ID，无法监听消息")
+            sys.exit(1)
+
+        if not self.config["target_chat_ids"]:
+            logger.error("未配置目标聊天ID，无法转发消息")
+            sys.exit(1)
+
+        if self.config["ingest_when_full"] not in WHEN_FULL:
+            logger.error(f"INGEST_WHEN_FULL 必须是 {', '.join(WHEN_FULL)} 之一")
+            sys.exit(1)
+
+        logger.info("从环境变量加载配置成功")
+
+    def build_config(self, env: Dict[str, str]) -> Dict[str, Any]:
+        """从环境变量（合并配置文件后）构建配置"""
+        return {
             # Telegram 配置
-            "api_id": os.environ.get("TELEGRAM_API_ID", "26420098"),
-            "api_hash": os.environ.get(
+            "api_id": env.get("TELEGRAM_API_ID", "26420098"),
+            "api_hash": env.get(
                 "TELEGRAM_API_HASH", "658109d6abe6705d9097649547c51429"
             ),
             # Replace session_string with session_file
-            "session_file": os.environ.get("TELEGRAM_SESSION_FILE", "vvvvvvvvv_bot"),
+            "session_file": env.get("TELEGRAM_SESSION_FILE", "vvvvvvvvv_bot"),
+            # 额外的发送账号（generate_session.py 生成的session string），多个用逗号分隔
+            "sender_session_strings": [
+                session.strip()
+                for session in env.get("SENDER_SESSION_STRINGS", "").split(",")
+                if session.strip()
+            ],
             # 管理员用户ID列表
             "admin_ids": [
                 int(id.strip())
-                for id in os.environ.get("TELEGRAM_ADMIN_IDS", "6259865244").split(",")
+                for id in env.get("TELEGRAM_ADMIN_IDS", "6259865244").split(",")
                 if id.strip()
             ],
             # 源聊天ID列表 (现在是频道ID)
             "source_channel_ids": [
                 int(id.strip())
-                for id in os.environ.get(
+                for id in env.get(
                     "TELEGRAM_SOURCE_CHANNEL_IDS", "-1001860934256"
                 ).split(",")
                 if id.strip()
@@ -75,73 +285,127 @@ class VVVVVVVVVBot:
             # 目标转发聊天ID列表
             "target_chat_ids": [
                 int(id.strip())
-                for id in os.environ.get(
+                for id in env.get(
                     "TELEGRAM_TARGET_CHAT_IDS", "7190974876"
                 ).split(",")
                 if id.strip()
             ],
+            # 单独设置筛选等级的目标，格式 "目标ID:等级,目标ID:等级"，未设置的跟随全局等级
+            "target_levels": env.get("TELEGRAM_TARGET_LEVELS", ""),
+            # 单独设置筛选规则的目标，JSON格式 {"目标ID": "规则"}
+            "target_rules": env.get("TELEGRAM_TARGET_RULES", ""),
+            # 多字段筛选规则，例如 "level >= Good and twitter_score >= 60"，为空表示不启用
+            "filter_rule": env.get("FILTER_RULE", ""),
             # 是否启用去重功能
-            "enable_deduplication": os.environ.get(
+            "enable_deduplication": env.get(
                 "ENABLE_DEDUPLICATION", "true"
             ).lower()
             == "true",
             # 内存中存储的最大CA地址数量
-            "max_memory_addresses": int(os.environ.get("MAX_MEMORY_ADDRESSES", "1000")),
+            "max_memory_addresses": int(env.get("MAX_MEMORY_ADDRESSES", "1000")),
+            # CA地址去重的有效期（秒），过期后可再次转发，0表示永久有效
+            "dedup_ttl_seconds": int(env.get("DEDUP_TTL_SECONDS", "0")),
+            # 逐条消息调试日志的抽样比例（0~1，需要LOG_LEVEL=DEBUG），0表示关闭
+            "log_detail_sample_rate": float(
+                env.get("LOG_DETAIL_SAMPLE_RATE", "0")
+            ),
+            # 目标聊天实体缓存文件
+            "peer_cache_file": env.get("PEER_CACHE_FILE", "peer_cache.json"),
+            # 按消息文本缓存的解析结果数量，0表示不缓存
+            "parse_cache_size": int(env.get("PARSE_CACHE_SIZE", "1024")),
+            # 是否在事件层面预筛选，以及消息需包含的标记（逗号分隔，任一即可）
+            "prefilter_enabled": env.get("PREFILTER_ENABLED", "true").lower()
+            == "true",
+            "prefilter_markers": [
+                m.strip()
+                for m in env.get("PREFILTER_MARKERS", "CA").split(",")
+                if m.strip()
+            ],
+            # 没有标记时是否再检查裸地址，关闭后每条消息的判断更快，但只带地址的消息会被拒绝
+            "prefilter_raw_address": env.get("PREFILTER_RAW_ADDRESS", "true").lower()
+            == "true",
+            # 超过多少个字符的消息不再查找裸地址，长消息的判断开销不随长度增长
+            "prefilter_raw_address_max_length": int(
+                env.get("PREFILTER_RAW_ADDRESS_MAX_LENGTH", "300")
+            ),
+            # 接收队列的工作协程数，0表示在更新处理器中直接处理
+            "ingest_workers": int(env.get("INGEST_WORKERS", "4")),
+            # 接收队列上限，以及队列满时的处理方式: drop_oldest, drop_newest, block
+            "ingest_queue_size": int(env.get("INGEST_QUEUE_SIZE", "10000")),
+            "ingest_when_full": env.get("INGEST_WHEN_FULL", "drop_oldest"),
+            # 已交给发送流程、还没发完的转发数上限，达到后处理流程等待
+            "forward_max_pending": int(env.get("FORWARD_MAX_PENDING", "1000")),
+            # 同时向多少个目标发送消息
+            "fanout_concurrency": int(env.get("FANOUT_CONCURRENCY", "10")),
+            # 每个目标每秒最多发送的消息数及允许的突发数量
+            "target_rate_per_second": float(
+                env.get("TARGET_RATE_PER_SECOND", "1")
+            ),
+            "target_burst": int(env.get("TARGET_BURST", "3")),
+            # 启动时同时解析的聊天实体数
+            "warmup_concurrency": int(env.get("ENTITY_WARMUP_CONCURRENCY", "8")),
+            # 发送繁忙时按等级优先发送，低等级每多等这么多秒相当于提高一级
+            "priority_aging_seconds": float(env.get("PRIORITY_AGING_SECONDS", "5")),
+            # 同一等级内是否再按推特评分排优先级
+            "priority_by_twitter_score": env.get(
+                "PRIORITY_BY_TWITTER_SCORE", "false"
+            ).lower()
+            == "true",
+            # 积压（接收队列中的消息、等待中和进行中的发送数）或接收队列最早的消息排队
+            # 时间超过上限时自适应丢弃，两者都低于下限后逐级恢复
+            "shed_enabled": env.get("SHED_ENABLED", "false").lower() == "true",
+            "shed_high_water": int(env.get("SHED_HIGH_WATER", "50")),
+            "shed_low_water": int(env.get("SHED_LOW_WATER", "10")),
+            "shed_high_wait_seconds": float(env.get("SHED_HIGH_WAIT_SECONDS", "5")),
+            "shed_low_wait_seconds": float(env.get("SHED_LOW_WAIT_SECONDS", "1")),
+            # 丢弃期间超过多少秒的信号直接丢弃，以及每隔多少秒调整一级
+            "shed_max_age_seconds": float(env.get("SHED_MAX_AGE_SECONDS", "60")),
+            "shed_step_seconds": float(env.get("SHED_STEP_SECONDS", "5")),
+            # 是否合并发送：发送繁忙时，窗口内或凑够条数的CA合并为一条消息
+            "outbound_batching": env.get("OUTBOUND_BATCHING", "false").lower()
+            == "true",
+            "batch_window_ms": float(env.get("BATCH_WINDOW_MS", "250")),
+            "batch_max_items": int(env.get("BATCH_MAX_ITEMS", "10")),
+            # 启动或重连后是否补读监听频道错过的消息
+            "backfill_enabled": env.get("BACKFILL_ENABLED", "true").lower()
+            == "true",
+            # 只补读多少秒以内的消息，更早的信号不再转发
+            "backfill_max_age_seconds": float(
+                env.get("BACKFILL_MAX_AGE_SECONDS", "600")
+            ),
+            # 同时补读的频道数，以及每个频道最多补读的消息数
+            "backfill_concurrency": int(env.get("BACKFILL_CONCURRENCY", "4")),
+            "backfill_max_messages": int(
+                env.get("BACKFILL_MAX_MESSAGES", "500")
+            ),
+            # 频道处理进度文件
+            "checkpoint_file": env.get("CHECKPOINT_FILE", "checkpoints.json"),
+            # 指标接口监听地址和端口，端口为0表示不启动
+            "metrics_host": env.get("METRICS_HOST", "0.0.0.0"),
+            "metrics_port": int(env.get("METRICS_PORT", "9108")),
         }
 
-        # 验证必要配置是否存在
-        missing_configs = []
-        for key in [
-            "api_id",
-            "api_hash",
-        ]:  # Remove session_string from required configs
-            if not self.config.get(key):
-                missing_configs.append(key)
-
-        if missing_configs:
-            logger.error(f"缺少必要的环境变量: {', '.join(missing_configs)}")
-            sys.exit(1)
-
-        # 验证列表配置
-        if not self.config["admin_ids"]:
-            logger.warning("未配置管理员ID，某些功能可能无法使用")
-
-        if not self.config["source_channel_ids"]:
-            logger.error("未配置源频道ID，无法监听消息")
-            sys.exit(1)
-
-        if not self.config["target_chat_ids"]:
-            logger.error("未配置目标聊天ID，无法转发消息")
-            sys.exit(1)
-
-        logger.info("从环境变量加载配置成功")
-
     def register_handlers(self):
-        """注册消息处理器"""
-        # 处理命令
-        self.client.add_event_handler(
-            self.handle_commands,
-            events.NewMessage(pattern=r"^/(set|help|status|clear)($|\s.*)"),
-        )
-
+        """注册消息处理器：所有消息只走一个入口，按聊天ID分发"""
         # 打印配置信息以便调试
         logger.info(f"监听的频道IDs: {self.config['source_channel_ids']}")
         logger.info(f"目标转发群组/用户IDs: {self.config['target_chat_ids']}")
 
-        # 处理监听的频道消息
-        for channel_id in self.config["source_channel_ids"]:
-            logger.info(f"注册监听: 频道 {channel_id} 的消息")
-            self.client.add_event_handler(
-                self.handle_VVVVVVVVV_message,
-                events.NewMessage(chats=channel_id),
-            )
+        # 监听的频道消息按聊天ID分发到处理流程，其他以"/"开头的消息才尝试匹配命令
+        self.router = ChannelRouter(self.handle_commands, COMMAND_PATTERN)
+        self.router.set_routes(
+            (channel_id, self.receive_message)
+            for channel_id in self.config["source_channel_ids"]
+        )
+        self.client.add_event_handler(
+            self.router.dispatch, events.NewMessage(func=self.accept_message)
+        )
 
         logger.info("事件处理器注册成功")
 
     async def handle_commands(self, event):
         """处理命令消息"""
-        sender = await event.get_sender()
-        sender_id = sender.id
+        sender_id = event.sender_id
 
         # 检查发送者是否是管理员
         if sender_id not in self.config["admin_ids"]:
@@ -160,6 +424,10 @@ class VVVVVVVVVBot:
 
             level = command_parts[1]
             await self.handle_set_command(event, level)
+        elif command == "rule":
+            await self.handle_rule_command(
+                event, event.raw_text[len(command) + 1 :].strip()
+            )
         elif command == "status":
             await self.handle_status_command(event)
         elif command == "clear":
@@ -170,6 +438,7 @@ class VVVVVVVVVBot:
         help_text = (
             "🤖 VVVVVVVVV监测机器人使用帮助:\n\n"
             "/set [等级] - 设置筛选等级\n"
+            "/rule [规则|off] - 设置多字段筛选规则，不带参数时查看当前规则\n"
             "/status - 查看当前设置状态\n"
             "/clear - 清空内存中存储的CA地址记录\n"
             "/help - 显示此帮助信息\n\n"
@@ -179,7 +448,10 @@ class VVVVVVVVVBot:
             "- Normal: 仅转发Normal及以上等级\n"
             "- Good: 仅转发Good及以上等级\n"
             "- Excellent: 仅转发Excellent等级\n"
-            "- All: 转发所有消息，不筛选等级"
+            "- All: 转发所有消息，不筛选等级\n\n"
+            "规则示例: level >= Good and (twitter_score >= 60 or followers >= 10000)\n"
+            "规则字段: level, twitter_score, market_value, followers\n"
+            "比较: >= > <= < == !=，组合: and or not 和括号；消息需同时满足等级和规则"
         )
         await event.respond(help_text)
 
@@ -192,8 +464,29 @@ class VVVVVVVVVBot:
             return
 
         self.current_level = level
+        self.rebuild_routes()
         await event.respond(f"✅ 已设置筛选等级为 {level}")
 
+    async def handle_rule_command(self, event, source):
+        """处理rule命令"""
+        if not source:
+            rule = self.rule_filter.rule
+            await event.respond(
+                f"🔍 当前筛选规则: {rule.source if rule else '未设置'}"
+            )
+            return
+
+        if source.lower() == "off":
+            source = ""
+        try:
+            rule = self.rule_filter.set(source)
+        except RuleError as e:
+            await event.respond(f"❌ 无效的规则: {e}")
+            return
+
+        text = f"已设置筛选规则: {rule.source}" if rule else "已关闭规则筛选"
+        await event.respond(f"✅ {text}")
+
     async def handle_status_command(self, event):
         """处理status命令"""
         # 获取当前登录账号信息
@@ -201,295 +494,456 @@ class VVVVVVVVVBot:
         is_bot = getattr(me, "bot", False)
         account_type = "机器人" if is_bot else "用户账号"
 
-        # 准备目标接收者列表文本
-        target_list = "\n".join(
-            [f"- {chat_id}" for chat_id in self.config["target_chat_ids"]]
-        )
+        # 准备目标接收者列表文本（附带发送统计）
+        target_lines = []
+        for chat_id in self.config["target_chat_ids"]:
+            stats = self.fanout.stats.get(chat_id)
+            name = self.names.get(chat_id)
+            route = self.target_router.describe(chat_id)
+            if stats is None:
+                target_lines.append(f"- {chat_id} ({name}) [{route}]")
+                continue
+            line = (
+                f"- {chat_id} ({name}) [{route}]: 成功 {stats.sent} / 失败 {stats.failed}，"
+                f"平均耗时 {stats.avg_latency * 1000:.0f}ms，"
+                f"最大 {stats.max_latency * 1000:.0f}ms"
+            )
+            paused = self.fanout.paused_for(chat_id)
+            if paused:
+                line += f"，FloodWait暂停剩余 {paused:.0f}秒"
+            target_lines.append(line)
+        target_list = "\n".join(target_lines)
         if not target_list:
             target_list = "- 未配置"
 
         # 准备监听频道列表文本
         source_list = "\n".join(
-            [f"- {chat_id}" for chat_id in self.config["source_channel_ids"]]
+            [
+                f"- {chat_id} ({self.names.get(chat_id)})"
+                for chat_id in self.config["source_channel_ids"]
+            ]
         )
         if not source_list:
             source_list = "- 未配置"
 
+        dedup_stats = self.processed_ca_addresses.stats()
+        dedup_ttl = (
+            f"{self.config['dedup_ttl_seconds']}秒"
+            if self.config["dedup_ttl_seconds"] > 0
+            else "永久"
+        )
+
+        peer_stats = self.peer_cache.stats()
+
+        rule = self.rule_filter.rule
+        rule_text = "未设置"
+        if rule is not None:
+            rule_text = (
+                f"{rule.source}（通过 {self.rule_filter.passed} 条，"
+                f"拦截 {self.rule_filter.rejected} 条）"
+            )
+
+        batch_text = ""
+        if self.batcher is not None:
+            batch_stats = self.batcher.stats()
+            batch_text = (
+                f"- 合并发送: {batch_stats['items']} 个CA 合并为 {batch_stats['batches']} 条消息，"
+                f"最大一批 {batch_stats['max_batch']} 个\n"
+            )
+
+        parse_cache_text = "- 解析缓存: 未启用\n"
+        if self.parse_cache is not None:
+            cache_stats = self.parse_cache.stats()
+            parse_cache_text = (
+                f"- 解析缓存: {cache_stats['size']} / {self.parse_cache.capacity} 条，"
+                f"命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}"
+                f"（命中率 {cache_stats['hit_rate']:.1%}），淘汰 {cache_stats['evictions']} 条\n"
+            )
+
+        prefilter_text = "- 预筛选: 未启用\n"
+        if self.prefilter is not None:
+            prefilter_stats = self.prefilter.stats()
+            prefilter_text = (
+                f"- 预筛选: 通过 {prefilter_stats['passed']} 条，拒绝 空消息 "
+                f"{prefilter_stats['rejected_empty']} 条 / 无标记 {prefilter_stats['rejected_no_marker']} 条\n"
+            )
+
+        ingest_text = "- 接收队列: 未启用\n"
+        if self.ingest is not None:
+            ingest_stats = self.ingest.stats()
+            ingest_text = (
+                f"- 接收队列: 当前 {ingest_stats['depth']} / 上限 {self.ingest.maxsize}，"
+                f"最多 {ingest_stats['max_depth']}，丢弃 {ingest_stats['dropped']} 条，"
+                f"平均排队 {ingest_stats['avg_wait'] * 1000:.1f}ms，"
+                f"最长 {ingest_stats['max_wait'] * 1000:.0f}ms，"
+                f"发送中的转发 {len(self.forwards)} 条\n"
+            )
+
+        shed_text = "- 自适应丢弃: 未启用\n"
+        if self.shedder is not None:
+            shed_stats = self.shedder.stats()
+            state = (
+                f"已提高 {shed_stats['boost']} 级（有效等级 {self.shedder.effective_level(self.current_level)}）"
+                if shed_stats["boost"]
+                else "未触发"
+            )
+            shed_text = (
+                f"- 自适应丢弃: {state}，当前积压 {self.outbound_backlog()}，"
+                f"接收队列最早排队 {self.ingest.oldest_wait() if self.ingest is not None else 0:.1f}秒，"
+                f"已丢弃过时 {shed_stats['shed_too_old']} 条 / 低等级 {shed_stats['shed_level']} 条，"
+                f"触发 {shed_stats['activations']} 次\n"
+            )
+
+        sender_text = ""
+        if self.sender_pool is not None:
+            for sender in self.sender_pool.stats():
+                sender_text += (
+                    f"- 发送账号 {sender['name']}: 成功 {sender['sent']} / 失败 {sender['failed']}，"
+                    f"FloodWait {sender['flood_waits']} 次"
+                )
+                if sender["paused_for"]:
+                    sender_text += f"，暂停剩余 {sender['paused_for']:.0f}秒"
+                sender_text += "\n"
+
+        config_text = "- 配置热加载: 未启用\n"
+        if self.config_watcher is not None:
+            config_stats = self.config_watcher.stats()
+            config_text = (
+                f"- 配置热加载: {self.config_watcher.path}，已重新加载 {config_stats['reloads']} 次，"
+                f"失败 {config_stats['errors']} 次\n"
+            )
+
+        backfill_text = "- 历史补读: 未启用\n"
+        if self.backfill is not None:
+            backfill_stats = self.backfill.stats()
+            backfill_text = (
+                f"- 历史补读: {backfill_stats['runs']} 轮，读取 {backfill_stats['fetched']} 条，"
+                f"处理 {backfill_stats['processed']} 条，记录进度的频道 {backfill_stats['channels']} 个，"
+                f"发现漏收 {backfill_stats['gaps_found']} 次，待补读 {backfill_stats['pending_gaps']} 个频道，"
+                f"读取失败 {backfill_stats['failures']} 次\n"
+            )
+
         status_text = (
             f"📊 当前状态信息\n\n"
             f"👤 登录账号: {me.first_name} (@{me.username if me.username else '无用户名'})\n"
             f"📱 账号类型: {account_type}\n"
-            f"🔍 当前筛选等级: {self.current_level}\n\n"
+            f"🔍 当前筛选等级: {self.current_level}\n"
+            f"🧮 筛选规则: {rule_text}\n\n"
             f"🔢 统计信息\n"
-            f"- 内存中存储的CA地址数量: {len(self.processed_ca_addresses)}\n\n"
+            f"- 内存中存储的CA地址数量: {dedup_stats['size']}\n"
+            f"- 去重命中/未命中: {dedup_stats['hits']}/{dedup_stats['misses']}\n"
+            f"- 容量淘汰/过期清理: {dedup_stats['evictions']}/{dedup_stats['expirations']}\n"
+            f"{prefilter_text}"
+            f"{parse_cache_text}"
+            f"- 消息分发: 监听频道 {self.router.routed} 条，命令 {self.router.commands} 条，"
+            f"忽略 {self.router.ignored} 条\n"
+            f"- 实体缓存: {peer_stats['size']} 个，命中 {peer_stats['hits']} 次，"
+            f"未命中 {peer_stats['misses']} 次，网络解析 {peer_stats['resolved']} 次\n"
+            f"{batch_text}"
+            f"{ingest_text}"
+            f"{shed_text}"
+            f"{sender_text}"
+            f"{config_text}"
+            f"{backfill_text}\n"
             f"🎯 目标接收者列表:\n{target_list}\n\n"
             f"📡 监听的频道:\n{source_list}\n\n"
             f"⚙️ 功能设置\n"
             f"- 去重功能: {'已启用' if self.config['enable_deduplication'] else '已禁用'}\n"
-            f"- 最大内存存储地址数: {self.config['max_memory_addresses']}"
+            f"- 最大内存存储地址数: {self.config['max_memory_addresses']}\n"
+            f"- 去重有效期: {dedup_ttl}"
         )
 
         await event.respond(status_text)
 
     async def handle_clear_command(self, event):
         """处理clear命令，清空内存中的CA地址记录"""
-        old_count = len(self.processed_ca_addresses)
-        self.processed_ca_addresses.clear()
+        old_count = self.processed_ca_addresses.clear()
         await event.respond(f"✅ 已清空内存中的CA地址记录，共清除 {old_count} 条记录")
 
+    def accept_message(self, event) -> bool:
+        """NewMessage 的过滤函数：先记录收到的消息ID以发现漏收，再做预筛选"""
+        if self.backfill is not None:
+            self.backfill.observe(event.chat_id, event.id)
+        if self.prefilter is not None:
+            return self.prefilter(event)
+        return True
+
+    async def receive_message(self, event):
+        """监听频道消息的入口：放入接收队列，未启用队列时直接处理"""
+        if self.ingest is not None:
+            await self.ingest.submit(event)
+        else:
+            await self.handle_VVVVVVVVV_message(event)
+
     async def handle_VVVVVVVVV_message(self, event):
         """处理接收到的VVVVVVVVV消息"""
-        # 打印完整的event信息，帮助调试
-        logger.info(f"收到消息 event: {event}")
+        # 是否为本条消息记录详细调试日志（抽样，默认关闭）
+        metrics = self.metrics
+        metrics.received.inc()
 
-        # 获取消息来源的详细信息
-        sender = await event.get_sender()
-        sender_id = sender.id
-        chat = await event.get_chat()
-        chat_id = chat.id
+        # 推进该频道的处理进度，重启后从这里开始补读
+        if self.backfill is not None:
+            self.backfill.mark(event.chat_id, event.message.id)
 
-        # 打印消息来源细节
-        logger.info(
-            f"消息来源 - 发送者ID: {sender_id}, 姓名: {getattr(sender, 'first_name', '未知')}, 用户名: {getattr(sender, 'username', '无')}"
-        )
-        logger.info(
-            f"消息来源 - 聊天ID: {chat_id}, 聊天标题: {getattr(chat, 'title', '私聊')}"
-        )
-
-        # 打印消息内容
-        logger.info(f"消息内容: {event.message.text}")
+        log_detail = self.log_detail()
+        if log_detail:
+            logger.debug("收到消息 event: %s", event)
 
         message_text = event.message.text
 
-        # 尝试解析消息
-        VVVVVVVVV_data = self.parse_VVVVVVVVV_message(message_text)
+        # 打印消息来源细节和内容，只使用更新中自带的ID和本地名称缓存，不发起网络请求
+        if log_detail:
+            chat_id = event.chat_id
+            sender_id = event.sender_id
+            logger.debug(
+                "消息来源 - 聊天ID: %s (%s), 发送者ID: %s (%s)",
+                chat_id,
+                self.names.get(chat_id),
+                sender_id,
+                self.names.get(sender_id),
+            )
+            logger.debug("消息内容: %s", message_text)
+            self.names.ensure(self.client, chat_id)
+            self.names.ensure(self.client, sender_id)
+
+        # 尝试解析消息，相同文本命中缓存时不再解析
+        started = time.perf_counter()
+        VVVVVVVVV_data = self.parse(message_text)
+        parsed_at = time.perf_counter()
+        metrics.parse_seconds.observe(parsed_at - started)
 
         if not VVVVVVVVV_data:
             logger.debug("收到的消息不是有效的VVVVVVVVV消息")
             return
+        metrics.parsed.inc()
 
-        # 检查消息等级是否符合筛选条件
-        if not self.should_forward_by_level(VVVVVVVVV_data):
-            logger.info(
-                f"消息等级不符合筛选条件: {VVVVVVVVV_data.get('level', 'Unknown')}, 当前筛选等级: {self.current_level}"
+        # 检查筛选规则，再按等级索引一次取出接收目标
+        recipients = (
+            self.target_router.recipients(VVVVVVVVV_data)
+            if self.rule_filter(VVVVVVVVV_data)
+            else ()
+        )
+        metrics.filter_seconds.observe(time.perf_counter() - parsed_at)
+        if not recipients:
+            metrics.filtered.labels(
+                metrics.level_label(VVVVVVVVV_data.get("level", "Unknown"))
+            ).inc()
+            logger.debug(
+                "消息不符合任何目标的筛选条件: 等级 %s, 全局筛选等级: %s",
+                VVVVVVVVV_data.get("level", "Unknown"),
+                self.current_level,
             )
             return
 
+        # 发送积压时自适应丢弃：提高有效等级，或丢弃已经过时的信号
+        if self.shedder is not None:
+            reason = self.shedder.check(
+                VVVVVVVVV_data["level"], event.message.date, self.current_level
+            )
+            if reason is not None:
+                metrics.shed.labels(
+                    reason, metrics.level_label(VVVVVVVVV_data["level"])
+                ).inc()
+                logger.debug(
+                    "发送积压，丢弃信号 %s（原因: %s，等级: %s）",
+                    VVVVVVVVV_data.get("ca_address"),
+                    reason,
+                    VVVVVVVVV_data["level"],
+                )
+                return
+
         # 获取CA地址
         ca_address = VVVVVVVVV_data.get("ca_address", "")
         if not ca_address:
             logger.error("无法提取CA地址")
             return
 
-        # 如果启用了去重功能，检查是否已经处理过该CA地址
-        if (
-            self.config["enable_deduplication"]
-            and ca_address in self.processed_ca_addresses
-        ):
-            logger.info(f"CA地址 {ca_address} 已经处理过，跳过")
-            return
-
-        # 将CA地址添加到已处理集合中
-        self.processed_ca_addresses.add(ca_address)
+        # 如果启用了去重功能，检查是否已经处理过该CA地址（同时记录本次地址）
+        if self.config["enable_deduplication"]:
+            dedup_started = time.perf_counter()
+            duplicate = self.processed_ca_addresses.seen(ca_address)
+            metrics.dedup_seconds.observe(time.perf_counter() - dedup_started)
+            if duplicate:
+                metrics.deduplicated.inc()
+                logger.debug("CA地址 %s 已经处理过，跳过", ca_address)
+                return
 
-        # 如果超过最大存储数量，移除最早的记录
-        if len(self.processed_ca_addresses) > self.config["max_memory_addresses"]:
-            # 移除一个元素（由于set无序，这里只能随机移除）
-            self.processed_ca_addresses.pop()
+        # 发送繁忙时高等级的信号先发
+        priority = signal_priority(
+            VVVVVVVVV_data, self.config["priority_by_twitter_score"]
+        )
+        await self.start_forward(ca_address, recipients, event.message.date, priority)
+
+    async def start_forward(
+        self, ca_address: str, recipients, message_date, priority: float = 0.0
+    ):
+        """在后台转发CA地址，发送中的转发达到上限时等待空位"""
+        await self.forward_slots.acquire()
+        task = asyncio.create_task(
+            self._forward_in_background(ca_address, recipients, message_date, priority)
+        )
+        self.forwards.add(task)
+        task.add_done_callback(self.forwards.discard)
 
-        # 发送CA地址到目标聊天
-        for chat_id in self.config["target_chat_ids"]:
-            try:
-                await self.send_message_to_target(chat_id, ca_address)
-                logger.info(f"已将CA地址 {ca_address} 发送到聊天 {chat_id}")
-            except Exception as e:
-                logger.error(f"发送CA地址失败: {e}")
+    async def _forward_in_background(
+        self, ca_address: str, recipients, message_date, priority: float
+    ):
+        try:
+            await self.forward_ca(ca_address, recipients, message_date, priority)
+        except Exception as e:
+            logger.error(f"转发CA地址 {ca_address} 失败: {e}")
+        finally:
+            self.forward_slots.release()
+
+    async def forward_ca(
+        self, ca_address: str, recipients, message_date, priority: float = 0.0
+    ):
+        """并发发送CA地址到所有接收目标"""
+        if self.batcher is not None:
+            results = await self.batcher.submit(recipients, ca_address, priority)
+        else:
+            results = await self.fanout.dispatch(recipients, ca_address, priority)
+        if any(results.values()):
+            self.metrics.forwarded.inc()
+            if not self.first_forward_seen:
+                self.record_first_forward()
+            # 消息时间只精确到秒
+            self.metrics.forward_delay.observe(
+                max(0.0, time.time() - message_date.timestamp())
+            )
+        failed = [chat_id for chat_id, ok in results.items() if not ok]
+        if failed:
+            logger.error("CA地址 %s 发送失败的聊天: %s", ca_address, failed)
+        else:
+            logger.info("已将CA地址 %s 发送到全部 %d 个聊天", ca_address, len(results))
 
     def parse_VVVVVVVVV_message(self, message_text: str) -> Optional[Dict[str, Any]]:
         """解析VVVVVVVVV消息，提取CA地址和等级等信息"""
         try:
-            # 打印原始消息文本，用于调试
-            logger.info(
-                f"开始解析消息: {message_text[:200]}..."
-            )  # 限制长度避免日志过大
-
-            # 尝试多种CA地址匹配模式
-            ca_patterns = [
-                r"🪙CA地址: ([^\s]+)",
-                r"🪙\s*CA地址\s*:\s*([^\s]+)",
-                r"CA地址\s*:\s*([^\s]+)",
-                r"CA地址:\s*([^\s]+)",
-                r"CA\s*:\s*([^\s]+)",
-                r"CA:([^\s]+)",
-                r"([a-zA-Z0-9]{40,42})",  # 尝试直接匹配CA地址格式
-            ]
-
-            ca_address = None
-            for pattern in ca_patterns:
-                ca_match = re.search(pattern, message_text)
-                if ca_match:
-                    ca_address = ca_match.group(1)
-                    logger.info(f"匹配到CA地址: {ca_address}，使用模式: {pattern}")
-                    break
-
-            if not ca_address:
-                logger.info("未能匹配到CA地址")
-                return None
-
-            # 尝试多种等级匹配模式
-            level_patterns = [
-                r"等级: (\w+)",
-                r"等级\s*:\s*(\w+)",
-                r"level\s*:\s*(\w+)",
-                r"Level\s*:\s*(\w+)",
-            ]
-
-            level = "Unknown"
-            for pattern in level_patterns:
-                level_match = re.search(pattern, message_text)
-                if level_match:
-                    level = level_match.group(1)
-                    logger.info(f"匹配到等级: {level}，使用模式: {pattern}")
-                    break
-
-            # 如果没有找到明确的等级，尝试从消息内容推断
-            if level == "Unknown":
-                if "excellent" in message_text.lower():
-                    level = "Excellent"
-                elif "good" in message_text.lower():
-                    level = "Good"
-                elif "normal" in message_text.lower():
-                    level = "Normal"
-                elif "bad" in message_text.lower():
-                    level = "Bad"
-                logger.info(f"从消息内容推断等级: {level}")
-
-            # 提取其他可能需要的信息
-            twitter_score_patterns = [
-                r"📊Twiiter评分: (\d+)分",
-                r"Twiiter评分: (\d+)",
-                r"Twitter评分: (\d+)",
-                r"推特评分: (\d+)",
-            ]
-
-            twitter_score = 0
-            for pattern in twitter_score_patterns:
-                twitter_score_match = re.search(pattern, message_text)
-                if twitter_score_match:
-                    twitter_score = int(twitter_score_match.group(1))
-                    logger.info(
-                        f"匹配到Twitter评分: {twitter_score}，使用模式: {pattern}"
-                    )
-                    break
-
-            market_value_patterns = [
-                r"💰当前市值: (\d+)\s*K",
-                r"当前市值: (\d+)",
-                r"市值: (\d+)",
-            ]
-
-            current_market_value = 0
-            for pattern in market_value_patterns:
-                market_match = re.search(pattern, message_text)
-                if market_match:
-                    current_market_value = int(market_match.group(1))
-                    logger.info(
-                        f"匹配到当前市值: {current_market_value}，使用模式: {pattern}"
-                    )
-                    break
-
-            followers_patterns = [
-                r"🙎粉丝数: (\d+)",
-                r"粉丝数: (\d+)",
-                r"followers: (\d+)",
-                r"Followers: (\d+)",
-            ]
-
-            followers = 0
-            for pattern in followers_patterns:
-                followers_match = re.search(pattern, message_text)
-                if followers_match:
-                    followers = int(followers_match.group(1))
-                    logger.info(f"匹配到粉丝数: {followers}，使用模式: {pattern}")
-                    break
-
-            # 返回提取的信息
-            result = {
-                "ca_address": ca_address,
-                "level": level,
-                "twitter_score": twitter_score,
-                "current_market_value": current_market_value,
-                "followers": followers,
-                "raw_message": message_text,
-            }
-
-            logger.info(f"解析结果: {result}")
-            return result
+            result = parse_signal(message_text)
         except Exception as e:
             logger.error(f"解析消息失败: {e}")
             return None
 
-    def should_forward_by_level(self, VVVVVVVVV_data: Dict[str, Any]) -> bool:
-        """根据等级决定是否应该转发消息"""
-        # 如果设置为All，转发所有消息
-        if self.current_level == "All":
-            return True
-
-        message_level = VVVVVVVVV_data.get("level", "Unknown")
+        if result:
+            logger.debug("解析结果: %s", result)
+        return result
 
-        # 等级优先级: Bad < Normal < Good < Excellent
-        level_priority = {
-            "Bad": 0,
-            "Normal": 1,
-            "Good": 2,
-            "Excellent": 3,
-            "Unknown": -1,  # 未知等级
-        }
+    def load_target_filters(self):
+        """解析各目标单独设置的等级和规则，无效的配置保留原值"""
+        try:
+            self.target_levels = parse_target_levels(
+                self.config["target_levels"], LEVELS
+            )
+        except ValueError as e:
+            logger.error(f"TELEGRAM_TARGET_LEVELS 无效，已忽略: {e}")
+        try:
+            self.target_rules = parse_target_rules(self.config["target_rules"])
+        except ValueError as e:
+            logger.error(f"TELEGRAM_TARGET_RULES 无效，已忽略: {e}")
 
-        # 如果消息中没有等级或等级无效，按照最低级别处理
-        message_priority = level_priority.get(message_level, -1)
-        current_priority = level_priority.get(self.current_level, 1)  # 默认为Normal
+    async def reload_config(self, values: Dict[str, str]):
+        """应用配置文件的修改，客户端连接保持不变，只更新可热更新的部分"""
+        try:
+            new_config = self.build_config({**os.environ, **values})
+        except ValueError as e:
+            logger.error(f"配置文件中有无效的值，保持当前配置: {e}")
+            return
+        if not new_config["source_channel_ids"] or not new_config["target_chat_ids"]:
+            logger.error("配置文件中的源频道或目标聊天为空，保持当前配置")
+            return
+        if new_config["max_memory_addresses"] <= 0:
+            logger.error("MAX_MEMORY_ADDRESSES 必须大于0，保持当前配置")
+            return
 
-        # 消息等级优先级需要大于等于当前设置的过滤等级
-        return message_priority >= current_priority
+        restart_needed = [
+            key
+            for key, value in new_config.items()
+            if key not in RELOADABLE_KEYS and value != self.config.get(key)
+        ]
+        if restart_needed:
+            logger.warning(f"以下配置的修改需要重启才能生效: {', '.join(restart_needed)}")
+        changed = [
+            key for key in RELOADABLE_KEYS if new_config[key] != self.config[key]
+        ]
+        if not changed:
+            return
+        for key in changed:
+            self.config[key] = new_config[key]
+
+        if "max_memory_addresses" in changed:
+            self.processed_ca_addresses.resize(self.config["max_memory_addresses"])
+        if "log_detail_sample_rate" in changed:
+            self.log_detail.rate = self.config["log_detail_sample_rate"]
+        if "target_levels" in changed or "target_rules" in changed:
+            self.load_target_filters()
+        if {"target_chat_ids", "target_levels", "target_rules"} & set(changed):
+            self.rebuild_routes()
+        if "target_chat_ids" in changed:
+            # 新目标的实体在后台解析，不阻塞消息处理
+            for chat_id in self.config["target_chat_ids"]:
+                self.names.ensure(self.client, chat_id)
+                if chat_id not in self.peer_cache:
+                    self.peer_cache.refresh_in_background(self.client, chat_id)
+        if "source_channel_ids" in changed:
+            self.router.set_routes(
+                (channel_id, self.receive_message)
+                for channel_id in self.config["source_channel_ids"]
+            )
+            for channel_id in self.config["source_channel_ids"]:
+                self.names.ensure(self.client, channel_id)
+            if self.backfill is not None:
+                self.backfill.channel_ids = self.config["source_channel_ids"]
+
+        logger.info(f"已重新加载配置: {', '.join(changed)}")
+
+    def outbound_backlog(self) -> int:
+        """积压的条数：接收队列中的消息，加上等待中和进行中的发送（含合并器中排队的CA）"""
+        backlog = self.fanout.pending
+        if self.batcher is not None:
+            backlog += len(self.batcher)
+        if self.ingest is not None:
+            backlog += len(self.ingest)
+        return backlog
+
+    def rebuild_routes(self):
+        """按当前全局等级和各目标的设置重建路由索引"""
+        self.target_router.build(
+            self.config["target_chat_ids"],
+            self.current_level,
+            self.target_levels,
+            self.target_rules,
+        )
 
     async def send_message_to_target(self, target_chat_id, message_text):
-        """发送消息到目标聊天"""
-        try:
-            logger.info(f"正在尝试向 {target_chat_id} 发送消息...")
+        """发送消息到目标聊天，配置了发送账号池时由账号池选择账号"""
+        if self.sender_pool is not None:
+            return await self.sender_pool.send(target_chat_id, message_text)
+        return await self.send_with(
+            self.client, self.peer_cache, target_chat_id, message_text
+        )
 
-            # 尝试直接发送消息
-            await self.client.send_message(target_chat_id, message_text)
-            logger.info(f"成功发送消息到 {target_chat_id}")
-            return True
-        except ValueError as e:
-            logger.warning(f"无法直接发送消息到 {target_chat_id}: {e}")
-
-            # 尝试获取实体后发送
-            try:
-                entity = await self.client.get_entity(target_chat_id)
-                await self.client.send_message(entity, message_text)
-                logger.info(f"通过获取实体成功发送消息到 {target_chat_id}")
-                return True
-            except Exception as entity_err:
-                logger.error(f"获取实体后发送消息失败: {entity_err}")
-
-                # 尝试从对话历史获取实体
-                try:
-                    dialogs = await self.client.get_dialogs(limit=50)
-                    for dialog in dialogs:
-                        if (
-                            hasattr(dialog.entity, "id")
-                            and dialog.entity.id == target_chat_id
-                        ):
-                            await self.client.send_message(dialog.entity, message_text)
-                            logger.info(f"通过对话历史成功发送消息到 {target_chat_id}")
-                            return True
-
-                    logger.error(f"在对话历史中未找到ID为 {target_chat_id} 的实体")
-                except Exception as dialog_err:
-                    logger.error(f"从对话历史获取实体失败: {dialog_err}")
+    async def send_with(self, client, peer_cache, target_chat_id, message_text):
+        """用指定账号发送消息，直接使用该账号缓存的实体"""
+        peer = peer_cache.get(target_chat_id)
+        if peer is None:
+            # 启动预热还没解析到该聊天，与预热共用同一次解析，之后不再走这里
+            peer = await peer_cache.resolve_shared(client, target_chat_id)
+            if peer is None:
+                return False
 
+        try:
+            await client.send_message(peer, message_text)
+            return True
+        except FloodWaitError:
+            # 交给调用方按提示的秒数暂停向该目标发送
+            raise
+        except (ValueError, PeerIdInvalidError, ChannelInvalidError) as e:
+            # 缓存的实体已失效，清除后在后台重新解析，不阻塞本次发送
+            logger.warning(f"聊天 {target_chat_id} 的缓存实体失效，后台重新解析: {e}")
+            peer_cache.invalidate(target_chat_id)
+            peer_cache.refresh_in_background(client, target_chat_id)
+            return False
         except Exception as e:
             error_msg = str(e).lower()
 
@@ -504,10 +958,69 @@ class VVVVVVVVVBot:
 
             return False
 
+    async def warm_up_entities(self):
+        """并发解析目标聊天和监听频道的实体，缓存中已有的不等待网络；完成后开始补读"""
+        targets = self.config["target_chat_ids"]
+        sources = self.config["source_channel_ids"]
+        logger.info(f"开始预热 {len(targets) + len(sources)} 个聊天实体...")
+        started = time.monotonic()
+        failed = set(
+            await self.peer_cache.warm_up(
+                self.client,
+                [*targets, *sources],
+                concurrency=self.config["warmup_concurrency"],
+                on_entity=self.names.put,
+            )
+        )
+        for chat_id in targets:
+            if chat_id in failed:
+                logger.warning(
+                    f"无法解析目标聊天 {chat_id}，这可能导致无法向该聊天发送消息。请确保已与该用户/群组有过交互"
+                )
+        for channel_id in sources:
+            if channel_id in failed:
+                logger.error(
+                    f"无法获取频道ID {channel_id} 的实体，这将导致无法监听该频道的消息。请确保用户已订阅该频道"
+                )
+        self.metrics.startup_seconds.labels("warmup").set(
+            time.monotonic() - self.started_at
+        )
+        logger.info(
+            f"实体预热完成，失败 {len(failed)} 个，耗时 {time.monotonic() - started:.2f} 秒"
+        )
+
+        # 补读需要频道实体，预热完成后再开始
+        if self.backfill is not None:
+            self.backfill.start(self.config["source_channel_ids"])
+
+        if self.sender_pool is not None:
+            await self.sender_pool.warm_up(
+                targets, concurrency=self.config["warmup_concurrency"]
+            )
+
+    def record_first_forward(self):
+        """记录启动后第一次成功转发的耗时"""
+        self.first_forward_seen = True
+        elapsed = time.monotonic() - self.started_at
+        self.metrics.startup_seconds.labels("first_forward").set(elapsed)
+        logger.info(f"启动后首次转发信号，距启动 {elapsed:.2f} 秒")
+
     async def start(self):
         """启动机器人"""
         logger.info("开始初始化机器人...")
 
+        # 启动指标接口
+        if self.config["metrics_port"]:
+            self.metrics_server = await start_metrics_server(
+                self.metrics.registry,
+                self.config["metrics_host"],
+                self.config["metrics_port"],
+            )
+
+        # 启动接收队列的工作协程，连接后到达的消息立即开始处理
+        if self.ingest is not None:
+            self.ingest.start()
+
         # 启动Telethon客户端
         try:
             # 尝试使用用户模式登录
@@ -523,39 +1036,61 @@ class VVVVVVVVVBot:
             )
             sys.exit(1)
 
+        self.metrics.startup_seconds.labels("connected").set(
+            time.monotonic() - self.started_at
+        )
         me = await self.client.get_me()
         logger.info(
             f"已登录，用户: {me.first_name} (@{me.username if me.username else '无用户名'})"
         )
 
+        # 装载缓存的目标聊天实体
+        await self.peer_cache.load()
+        if self.backfill is not None:
+            await self.backfill.load()
+
         # 检查客户端是否是机器人
         is_bot = getattr(me, "bot", False)
         logger.info(f"当前客户端{'是' if is_bot else '不是'}机器人")
 
-        # 尝试获取所有目标聊天的实体
-        logger.info("尝试获取所有目标聊天的实体...")
-        for chat_id in self.config["target_chat_ids"]:
-            try:
-                entity = await self.client.get_entity(chat_id)
-                logger.info(f"成功获取目标聊天实体: {entity}")
-            except Exception as e:
-                logger.warning(f"无法获取聊天ID {chat_id} 的实体: {e}")
-                logger.warning(
-                    f"这可能导致无法向该聊天发送消息。请确保已与该用户/群组有过交互"
-                )
+        # 连接额外的发送账号，每个目标的发送速率按账号数放大
+        if self.sender_pool is not None:
+            await self.sender_pool.start()
+            # 账号池启动前已经有目标开始发送，已创建的令牌桶也要改成新速率
+            self.fanout.set_rate(
+                self.config["target_rate_per_second"] * len(self.sender_pool)
+            )
 
-        # 尝试获取所有监听频道的实体
-        logger.info("尝试获取所有监听频道的实体...")
-        for channel_id in self.config["source_channel_ids"]:
-            try:
-                entity = await self.client.get_entity(channel_id)
-                logger.info(f"成功获取监听频道实体: {entity}")
-            except Exception as e:
-                logger.error(f"无法获取频道ID {channel_id} 的实体: {e}")
-                logger.error(f"这将导致无法监听该频道的消息。请确保用户已订阅该频道")
+        # 在后台并发解析目标聊天和监听频道的实体，不阻塞实时消息处理
+        self.warmup_task = asyncio.create_task(self.warm_up_entities())
+
+        # 监视配置文件，修改后在运行中重新应用
+        if self.config_watcher is not None:
+            self.config_watcher.start()
 
         # 保持运行
-        await self.client.run_until_disconnected()
+        try:
+            await self.client.run_until_disconnected()
+        finally:
+            if self.warmup_task is not None:
+                self.warmup_task.cancel()
+            if self.ingest is not None:
+                await self.ingest.close()
+            if self.forwards:
+                _, unfinished = await asyncio.wait(self.forwards, timeout=5.0)
+                for task in unfinished:
+                    task.cancel()
+            if self.config_watcher is not None:
+                await self.config_watcher.close()
+            if self.sender_pool is not None:
+                await self.sender_pool.close()
+            if self.backfill is not None:
+                await self.backfill.close()
+            if self.batcher is not None:
+                await self.batcher.close()
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+                await self.metrics_server.wait_closed()
 
 
 async def main():
@@ -0,0 +1,369 @@
+"""Prometheus 文本格式的指标和内置 /metrics HTTP 接口"""
+
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# 处理阶段耗时（秒）
+STAGE_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+)
+# 单次发送耗时（秒）
+SEND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 消息在接收队列中的等待时间（秒）
+QUEUE_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+# 从消息发布到转发完成的延迟（秒）
+DELAY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """返回指定标签值的子指标"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, child in self._children.items():
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_function")
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        self._value += amount
+
+    def set_function(self, function: Callable[[], float]):
+        """输出时调用 function 取累计值，适合由其他组件自己计数的场景"""
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default.set_function(function)
+
+    def _render_child(self, key, child):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {child.value}"
+
+
+class _GaugeChild:
+    __slots__ = ("_value", "_function")
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """输出时调用 function 取当前值，适合队列长度这类随时变化的值"""
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+
+class Gauge(_Metric):
+    """可以任意设置的当前值"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default.set_function(function)
+
+    def _render_child(self, key, child):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {child.value}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """分桶统计，输出时转换为 Prometheus 的累计桶"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, key, child):
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+        yield f"{self.name}_bucket{labels} {child.count}"
+        plain = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{plain} {child.sum}"
+        yield f"{self.name}_count{plain} {child.count}"
+
+
+class Registry:
+    """指标集合"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class BotMetrics:
+    """机器人的全部指标"""
+
+    def __init__(self, levels: Iterable[str] = ()):
+        self.registry = Registry()
+        # 等级来自消息文本，只把已知等级作为标签值，避免标签数量失控
+        self._levels = set(levels)
+        r = self.registry.register
+
+        self.received = r(Counter("vvvbot_messages_received_total", "收到的监听频道消息数"))
+        self.parsed = r(Counter("vvvbot_messages_parsed_total", "解析出CA地址的消息数"))
+        self.filtered = r(
+            Counter(
+                "vvvbot_messages_filtered_total",
+                "因等级不符合筛选条件被过滤的消息数",
+                ["level"],
+            )
+        )
+        self.shed = r(
+            Counter(
+                "vvvbot_messages_shed_total",
+                "发送积压时自适应丢弃的消息数（reason: too_old/level）",
+                ["reason", "level"],
+            )
+        )
+        self.deduplicated = r(
+            Counter("vvvbot_messages_deduplicated_total", "因CA地址重复被跳过的消息数")
+        )
+        self.forwarded = r(
+            Counter("vvvbot_messages_forwarded_total", "至少成功发送到一个目标的消息数")
+        )
+        self.send_failures = r(
+            Counter("vvvbot_send_failures_total", "按目标统计的发送失败次数", ["target"])
+        )
+        self.stage_seconds = r(
+            Histogram(
+                "vvvbot_stage_duration_seconds",
+                "消息处理各阶段耗时",
+                ["stage"],
+                buckets=STAGE_BUCKETS,
+            )
+        )
+        self.send_seconds = r(
+            Histogram(
+                "vvvbot_send_duration_seconds",
+                "按目标统计的单次发送耗时",
+                ["target"],
+                buckets=SEND_BUCKETS,
+            )
+        )
+        self.forward_delay = r(
+            Histogram(
+                "vvvbot_forward_delay_seconds",
+                "从Telegram消息时间到转发完成的延迟",
+                buckets=DELAY_BUCKETS,
+            )
+        )
+
+        self.ingest_wait = r(
+            Histogram(
+                "vvvbot_ingest_queue_wait_seconds",
+                "消息在接收队列中等待处理的时间",
+                buckets=QUEUE_BUCKETS,
+            )
+        )
+        self.ingest_depth = r(
+            Gauge("vvvbot_ingest_queue_depth", "接收队列中等待处理的消息数")
+        )
+        self.ingest_dropped = r(
+            Counter("vvvbot_ingest_dropped_total", "接收队列已满时丢弃的消息数")
+        )
+        self.prefilter_passed = r(
+            Counter("vvvbot_prefilter_passed_total", "通过预筛选进入处理流程的消息数")
+        )
+        self.prefilter_rejected = r(
+            Counter(
+                "vvvbot_prefilter_rejected_total",
+                "预筛选拒绝的消息数（reason: empty/no_marker）",
+                ["reason"],
+            )
+        )
+        self.startup_seconds = r(
+            Gauge(
+                "vvvbot_startup_seconds",
+                "从启动到各阶段完成的耗时（connected/warmup/first_forward）",
+                ["stage"],
+            )
+        )
+
+        # 热路径上直接使用子指标，省去每次的标签查找
+        self.parse_seconds = self.stage_seconds.labels("parse")
+        self.filter_seconds = self.stage_seconds.labels("filter")
+        self.dedup_seconds = self.stage_seconds.labels("dedup")
+
+    def watch_prefilter(self, prefilter):
+        """预筛选在事件层面自己计数，指标输出时读取其计数"""
+        self.prefilter_passed.set_function(lambda: prefilter.passed)
+        self.prefilter_rejected.labels("empty").set_function(
+            lambda: prefilter.rejected_empty
+        )
+        self.prefilter_rejected.labels("no_marker").set_function(
+            lambda: prefilter.rejected_no_marker
+        )
+
+    def level_label(self, level: str) -> str:
+        return level if level in self._levels else "Unknown"
+
+    def observe_send(self, target: int, latency: float, ok: bool):
+        """FanoutDispatcher 每次发送后的回调"""
+        self.send_seconds.labels(target).observe(latency)
+        if not ok:
+            self.send_failures.labels(target).inc()
+
+
+async def start_metrics_server(
+    registry: Registry, host: str, port: int
+) -> Optional[asyncio.AbstractServer]:
+    """在当前事件循环上启动只提供 GET /metrics 的HTTP服务"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # 读完请求头
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status = "200 OK"
+                body = registry.render().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status = "404 Not Found"
+                body = b"not found\n"
+                content_type = "text/plain; charset=utf-8"
+
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode("latin-1")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    try:
+        server = await asyncio.start_server(handle, host, port)
+    except OSError as e:
+        logger.error(f"启动指标服务失败 {host}:{port}: {e}")
+        return None
+    logger.info(f"指标服务已启动: http://{host}:{port}/metrics")
+    return server
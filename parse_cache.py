@@ -0,0 +1,59 @@
+"""按消息文本缓存解析结果，重复转发的相同消息不再重新解析"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+ParseResult = Optional[Dict[str, Any]]
+
+
+class ParseCache:
+    """有容量上限的解析结果缓存，按最近使用淘汰
+
+    以消息文本为键（字典按文本的哈希查找，命中时再比较文本本身，不会误判），
+    不是信号的消息也缓存其 None 结果，重复出现时直接判定为无需处理。解析结果不依赖
+    筛选等级或规则，这些条件变化后缓存仍然有效；信号的筛选、去重照常进行。
+    缓存的结果在多条消息之间共享，调用方不能修改。
+    """
+
+    def __init__(self, parse: Callable[[str], ParseResult], capacity: int = 1024):
+        if capacity <= 0:
+            raise ValueError(f"capacity必须大于0: {capacity}")
+        self.parse = parse
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, ParseResult]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __call__(self, text: str) -> ParseResult:
+        entries = self._entries
+        try:
+            result = entries[text]
+        except KeyError:
+            pass
+        else:
+            entries.move_to_end(text)
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = self.parse(text)
+        entries[text] = result
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
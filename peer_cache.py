@@ -0,0 +1,335 @@
+"""已解析的聊天实体缓存：发送用的InputPeer和展示用的名称"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from telethon import utils
+from telethon.tl.types import (
+    InputPeerChannel,
+    InputPeerChat,
+    InputPeerSelf,
+    InputPeerUser,
+)
+
+from persistence import DelayedSave, write_json_atomic
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# 持久化格式: chat_id -> (类型, id, access_hash)
+PeerRow = Tuple[str, int, int]
+
+
+def dump_peer(peer) -> Optional[PeerRow]:
+    """把InputPeer转换为可持久化的三元组，不支持的类型返回None"""
+    if isinstance(peer, InputPeerChannel):
+        return ("channel", peer.channel_id, peer.access_hash)
+    if isinstance(peer, InputPeerUser):
+        return ("user", peer.user_id, peer.access_hash)
+    if isinstance(peer, InputPeerChat):
+        return ("chat", peer.chat_id, 0)
+    if isinstance(peer, InputPeerSelf):
+        return ("self", 0, 0)
+    return None
+
+
+def load_peer(row: PeerRow):
+    """把持久化的三元组还原为InputPeer"""
+    kind, peer_id, access_hash = row
+    if kind == "channel":
+        return InputPeerChannel(peer_id, access_hash)
+    if kind == "user":
+        return InputPeerUser(peer_id, access_hash)
+    if kind == "chat":
+        return InputPeerChat(peer_id)
+    if kind == "self":
+        return InputPeerSelf()
+    raise ValueError(f"未知的实体类型: {kind}")
+
+
+class FilePeerStore:
+    """保存在本地JSON文件中的实体缓存"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def load(self) -> Dict[int, PeerRow]:
+        if not os.path.exists(self.path):
+            return {}
+        return await asyncio.to_thread(self._read)
+
+    def _read(self) -> Dict[int, PeerRow]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {int(chat_id): tuple(row) for chat_id, row in data.items()}
+
+    async def save(self, rows: Dict[int, PeerRow]):
+        await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows: Dict[int, PeerRow]):
+        write_json_atomic(self.path, {str(k): list(v) for k, v in rows.items()})
+
+
+class DbPeerStore:
+    """保存在数据库 peer_cache 表中的实体缓存
+
+    access_hash 因账号而异，每行按 (account_id, chat_id) 保存，共用数据库的多个实例
+    使用不同账号时互不覆盖。
+    """
+
+    def __init__(self, pool, account_id: int):
+        self.pool = pool
+        self.account_id = account_id
+
+    async def load(self) -> Dict[int, PeerRow]:
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS peer_cache (
+                    account_id BIGINT NOT NULL,
+                    chat_id BIGINT NOT NULL,
+                    peer_type TEXT NOT NULL,
+                    peer_id BIGINT NOT NULL,
+                    access_hash BIGINT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (account_id, chat_id)
+                )
+                """
+            )
+            records = await conn.fetch(
+                """
+                SELECT chat_id, peer_type, peer_id, access_hash FROM peer_cache
+                WHERE account_id = $1
+                """,
+                self.account_id,
+            )
+        return {
+            r["chat_id"]: (r["peer_type"], r["peer_id"], r["access_hash"])
+            for r in records
+        }
+
+    async def save(self, rows: Dict[int, PeerRow]):
+        async with self.pool.acquire() as conn:
+            await conn.executemany(
+                """
+                INSERT INTO peer_cache (account_id, chat_id, peer_type, peer_id, access_hash)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (account_id, chat_id) DO UPDATE
+                SET peer_type = $3, peer_id = $4, access_hash = $5, updated_at = now()
+                """,
+                [(self.account_id, chat_id, *row) for chat_id, row in rows.items()],
+            )
+
+
+class PeerCache:
+    """以聊天ID为键的InputPeer缓存
+
+    启动时从存储装载，新解析到的实体会在后台写回存储。发送失败说明缓存可能过期，
+    此时清除该条目并在后台重新解析，不阻塞发送路径。
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._peers: Dict[int, object] = {}
+        self._refreshing: Dict[int, asyncio.Task] = {}
+        self._saver = DelayedSave(self.save)
+
+        self.hits = 0
+        self.misses = 0
+        self.resolved = 0
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._peers
+
+    def __len__(self) -> int:
+        return len(self._peers)
+
+    async def load(self):
+        """从存储装载缓存"""
+        if self.store is None:
+            return
+        try:
+            rows = await self.store.load()
+        except Exception as e:
+            logger.error(f"装载实体缓存失败: {e}")
+            return
+        for chat_id, row in rows.items():
+            try:
+                self._peers[chat_id] = load_peer(row)
+            except ValueError as e:
+                logger.warning(f"忽略聊天 {chat_id} 的缓存实体: {e}")
+        logger.info(f"已装载 {len(self._peers)} 个缓存的聊天实体")
+
+    def get(self, chat_id: int):
+        """返回缓存的InputPeer，没有时返回None"""
+        peer = self._peers.get(chat_id)
+        if peer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return peer
+
+    def put(self, chat_id: int, entity):
+        """缓存实体（任意可转换为InputPeer的对象）并安排写回存储"""
+        peer = utils.get_input_peer(entity)
+        if self._peers.get(chat_id) == peer:
+            return
+        self._peers[chat_id] = peer
+        self._schedule_save()
+
+    def invalidate(self, chat_id: int):
+        """清除一个缓存条目"""
+        self._peers.pop(chat_id, None)
+
+    async def resolve(
+        self,
+        client,
+        chat_id: int,
+        on_entity: Optional[Callable[[int, object], None]] = None,
+    ):
+        """通过网络解析聊天实体并写入缓存，失败返回None；on_entity 收到解析出的完整实体"""
+        entity = None
+        try:
+            entity = await client.get_entity(chat_id)
+        except Exception as e:
+            logger.warning(f"获取聊天 {chat_id} 的实体失败，尝试从对话列表查找: {e}")
+            try:
+                async for dialog in client.iter_dialogs(limit=50):
+                    if (
+                        dialog.id == chat_id
+                        or getattr(dialog.entity, "id", None) == chat_id
+                    ):
+                        entity = dialog.entity
+                        break
+            except Exception as dialog_err:
+                logger.error(f"从对话列表获取实体失败: {dialog_err}")
+
+        if entity is None:
+            logger.error(f"无法解析聊天ID {chat_id} 的实体")
+            return None
+
+        self.resolved += 1
+        self.put(chat_id, entity)
+        if on_entity is not None:
+            on_entity(chat_id, entity)
+        return self._peers[chat_id]
+
+    def _resolve_task(
+        self, client, chat_id: int, semaphore=None, on_entity=None
+    ) -> asyncio.Task:
+        """返回该聊天正在进行的解析任务，没有时新建，同一聊天同时只有一个解析任务"""
+        task = self._refreshing.get(chat_id)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(
+            self._resolve_limited(client, chat_id, semaphore, on_entity)
+        )
+        self._refreshing[chat_id] = task
+        task.add_done_callback(
+            lambda done: self._refreshing.get(chat_id) is done
+            and self._refreshing.pop(chat_id)
+        )
+        return task
+
+    async def _resolve_limited(self, client, chat_id: int, semaphore, on_entity):
+        if semaphore is None:
+            return await self.resolve(client, chat_id, on_entity)
+        async with semaphore:
+            return await self.resolve(client, chat_id, on_entity)
+
+    def refresh_in_background(self, client, chat_id: int):
+        """在后台重新解析实体"""
+        self._resolve_task(client, chat_id)
+
+    async def resolve_shared(self, client, chat_id: int):
+        """解析实体，该聊天已在解析（例如启动预热中）时等待同一个任务，不重复请求"""
+        return await asyncio.shield(self._resolve_task(client, chat_id))
+
+    async def warm_up(
+        self,
+        client,
+        chat_ids: Iterable[int],
+        concurrency: int = 8,
+        on_entity: Optional[Callable[[int, object], None]] = None,
+    ) -> List[int]:
+        """并发解析一批聊天，最多同时 concurrency 个，返回解析失败的聊天
+
+        没有缓存的先解析；已缓存的可以直接使用，之后再重新解析一遍以更新缓存。
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        chat_ids = list(dict.fromkeys(chat_ids))
+        missing = [chat_id for chat_id in chat_ids if chat_id not in self._peers]
+        cached = [chat_id for chat_id in chat_ids if chat_id in self._peers]
+
+        for group in (missing, cached):
+            await asyncio.gather(
+                *(
+                    self._resolve_task(client, chat_id, semaphore, on_entity)
+                    for chat_id in group
+                ),
+                return_exceptions=True,
+            )
+        # 重新解析失败时仍可使用原有的缓存
+        return [chat_id for chat_id in chat_ids if chat_id not in self._peers]
+
+    def _schedule_save(self):
+        if self.store is not None:
+            # 合并短时间内的多次写入
+            self._saver.schedule()
+
+    async def save(self):
+        """把全部缓存写回存储"""
+        if self.store is None:
+            return
+        rows: Dict[int, PeerRow] = {}
+        for chat_id, peer in self._peers.items():
+            row = dump_peer(peer)
+            if row is not None:
+                rows[chat_id] = row
+        try:
+            await self.store.save(rows)
+        except Exception as e:
+            logger.error(f"保存实体缓存失败: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._peers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "resolved": self.resolved,
+        }
+
+
+class NameCache:
+    """聊天/用户ID到显示名称的本地缓存
+
+    只用于日志和/status展示。缺失的名称在后台通过网络获取，消息处理路径只读字典。
+    """
+
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._pending = set()
+
+    def get(self, peer_id: Optional[int], default: str = "未知") -> str:
+        return self._names.get(peer_id, default)
+
+    def put(self, peer_id: int, entity):
+        """记录实体的显示名称"""
+        self._names[peer_id] = utils.get_display_name(entity) or str(peer_id)
+
+    def ensure(self, client, peer_id: Optional[int]):
+        """名称缺失时在后台获取"""
+        if peer_id is None or peer_id in self._names or peer_id in self._pending:
+            return
+        self._pending.add(peer_id)
+        asyncio.create_task(self._fetch(client, peer_id))
+
+    async def _fetch(self, client, peer_id: int):
+        try:
+            self.put(peer_id, await client.get_entity(peer_id))
+        except Exception as e:
+            logger.debug("获取 %s 的显示名称失败: %s", peer_id, e)
+        finally:
+            self._pending.discard(peer_id)
@@ -0,0 +1,50 @@
+"""后台写回存储的公共工具：定时批量写入、合并短时间内的多次保存、原子写JSON文件"""
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Optional
+
+
+async def flush_loop(
+    wakeup: asyncio.Event, interval: float, flush: Callable[[], Awaitable[None]]
+):
+    """每 interval 秒或 wakeup 被置位时调用一次 flush，直到任务被取消"""
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        await flush()
+
+
+class DelayedSave:
+    """合并短时间内的多次保存：schedule() 后等 delay 秒调用一次 save"""
+
+    def __init__(self, save: Callable[[], Awaitable[None]], delay: float = 1.0):
+        self.save = save
+        self.delay = delay
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有运行中的事件循环（例如启动前），等下一次调用时再保存
+            return
+        self._task = loop.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.delay)
+        await self.save()
+
+
+def write_json_atomic(path: str, data: Any):
+    """先写临时文件再替换，避免中途退出留下损坏的文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,70 @@
+"""在 NewMessage 事件层面预筛选，明显不是信号的消息不进入解析流程"""
+
+from typing import Dict, Iterable
+
+from telethon.tl.types import MessageEntityTextUrl
+
+from signal_parser import has_raw_address
+
+
+class PreFilter:
+    """作为 events.NewMessage(func=...) 使用的廉价预筛选
+
+    检查消息的原始文本，消息带文字链接时再加上链接的URL（解析器读取的 message.text
+    含有这些URL，地址只出现在链接里的消息也能通过），不为此还原整条消息的格式：
+    以"/"开头的命令直接放行；其余消息需要包含任一标记（默认"CA"，与解析器的CA标签
+    规则一致），没有标记时若 raw_address 为真、且文本不超过 raw_address_max_length
+    个字符，再检查是否有裸地址格式的字符串。默认配置下只会拒绝超过长度上限、又只带
+    裸地址不带标记的信号。
+    """
+
+    def __init__(
+        self,
+        markers: Iterable[str] = ("CA",),
+        raw_address: bool = True,
+        raw_address_max_length: int = 300,
+    ):
+        self.markers = tuple(m for m in markers if m)
+        self.raw_address = raw_address
+        self.raw_address_max_length = raw_address_max_length
+
+        self.passed = 0
+        self.rejected_empty = 0
+        self.rejected_no_marker = 0
+
+    def __call__(self, event) -> bool:
+        message = event.message
+        # 即 raw_text，直接读取消息对象的属性，不经过事件的属性转发
+        text = message.message or ""
+        entities = message.entities
+        if entities:
+            urls = [e.url for e in entities if isinstance(e, MessageEntityTextUrl)]
+            if urls:
+                text = "\n".join([text, *urls])
+        if not text:
+            self.rejected_empty += 1
+            return False
+        if text[0] == "/":
+            self.passed += 1
+            return True
+        for marker in self.markers:
+            if marker in text:
+                self.passed += 1
+                return True
+        # 长消息逐字符查找裸地址的开销与长度成正比，超过上限时不再查找
+        if (
+            self.raw_address
+            and len(text) <= self.raw_address_max_length
+            and has_raw_address(text)
+        ):
+            self.passed += 1
+            return True
+        self.rejected_no_marker += 1
+        return False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "passed": self.passed,
+            "rejected_empty": self.rejected_empty,
+            "rejected_no_marker": self.rejected_no_marker,
+        }
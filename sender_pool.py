@@ -0,0 +1,169 @@
+"""多个账号分担发送：监听仍只用主账号，发送在账号之间按负载分配"""
+
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telethon.errors import FloodWaitError
+
+from peer_cache import PeerCache
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+# send(客户端, 该账号的实体缓存, 目标, 内容) -> 是否成功，FloodWait 时抛出 FloodWaitError
+SendWith = Callable[[object, PeerCache, int, str], Awaitable[bool]]
+
+
+class Sender:
+    """一个发送账号及其状态"""
+
+    __slots__ = (
+        "name",
+        "client",
+        "peers",
+        "owned",
+        "in_flight",
+        "paused_until",
+        "sent",
+        "failed",
+        "flood_waits",
+    )
+
+    def __init__(self, name: str, client, peers: PeerCache, owned: bool):
+        self.name = name
+        self.client = client
+        # access_hash 因账号而异，每个账号使用自己的实体缓存
+        self.peers = peers
+        # 由账号池负责连接和断开（主账号由机器人自己管理）
+        self.owned = owned
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+
+
+class SenderPool:
+    """发送账号池
+
+    每次发送选择未处于 FloodWait 暂停、进行中发送最少（相同时累计发送最少）的账号。
+    某个账号触发 FloodWait 时只暂停该账号，本次发送立即换其他账号重试；发送失败（含
+    超时，消息可能已经送达）时只换一个账号再试一次，再失败即按失败处理，避免重复发送。
+    所有账号都在暂停时抛出 FloodWaitError（秒数为最早恢复的
+    账号剩余的时间），由 FanoutDispatcher 按原有方式暂停该目标。
+    """
+
+    def __init__(
+        self,
+        send_with: SendWith,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.send_with = send_with
+        self._clock = clock
+        self.senders: List[Sender] = []
+
+    def __len__(self) -> int:
+        return len(self.senders)
+
+    def add(self, name: str, client, peers: Optional[PeerCache] = None, owned: bool = True):
+        """加入一个发送账号"""
+        self.senders.append(Sender(name, client, peers or PeerCache(), owned))
+
+    async def start(self):
+        """连接账号池管理的客户端，未登录或连接失败的账号不参与发送"""
+        usable = []
+        for sender in self.senders:
+            if sender.owned:
+                try:
+                    await sender.client.connect()
+                    if not await sender.client.is_user_authorized():
+                        logger.error(f"发送账号 {sender.name} 的session未登录，已忽略")
+                        await sender.client.disconnect()
+                        continue
+                except Exception as e:
+                    logger.error(f"连接发送账号 {sender.name} 失败，已忽略: {e}")
+                    continue
+            usable.append(sender)
+        self.senders = usable
+        logger.info(f"发送账号池已启动，共 {len(self.senders)} 个账号")
+
+    async def warm_up(self, chat_ids: Iterable[int], concurrency: int = 8):
+        """为账号池管理的账号解析目标实体（主账号的实体由机器人预热）"""
+        chat_ids = list(chat_ids)
+        for sender in self.senders:
+            if not sender.owned:
+                continue
+            failed = await sender.peers.warm_up(sender.client, chat_ids, concurrency)
+            if failed:
+                logger.warning(f"发送账号 {sender.name} 无法解析目标 {failed}，将由其他账号发送")
+
+    def _candidates(self, exclude) -> List[Sender]:
+        now = self._clock()
+        candidates = [
+            s for s in self.senders if s.paused_until <= now and s not in exclude
+        ]
+        candidates.sort(key=lambda s: (s.in_flight, s.sent))
+        return candidates
+
+    async def send(self, target: int, message_text: str) -> bool:
+        """选择账号发送一条消息，成功返回True"""
+        tried = []
+        failures = 0
+        while True:
+            candidates = self._candidates(tried)
+            if not candidates:
+                break
+            sender = candidates[0]
+            tried.append(sender)
+
+            sender.in_flight += 1
+            try:
+                ok = await self.send_with(sender.client, sender.peers, target, message_text)
+            except FloodWaitError as e:
+                sender.paused_until = self._clock() + e.seconds
+                sender.flood_waits += 1
+                logger.warning(f"发送账号 {sender.name} 触发FloodWait，暂停使用 {e.seconds} 秒")
+                continue
+            finally:
+                sender.in_flight -= 1
+
+            if ok:
+                sender.sent += 1
+                return True
+            sender.failed += 1
+            failures += 1
+            if failures > 1:
+                break
+
+        # 有账号尝试过但失败，按失败处理；所有账号都在暂停时交给调用方暂停该目标
+        now = self._clock()
+        waits = [s.paused_until - now for s in self.senders if s.paused_until > now]
+        if waits and all(s.paused_until > now for s in tried):
+            raise FloodWaitError(request=None, capture=math.ceil(min(waits)))
+        return False
+
+    def paused_for(self, sender: Sender) -> float:
+        return max(0.0, sender.paused_until - self._clock())
+
+    async def close(self):
+        """断开账号池管理的客户端"""
+        for sender in self.senders:
+            if sender.owned:
+                try:
+                    await sender.client.disconnect()
+                except Exception as e:
+                    logger.error(f"断开发送账号 {sender.name} 失败: {e}")
+
+    def stats(self) -> List[Dict[str, float]]:
+        return [
+            {
+                "name": s.name,
+                "sent": s.sent,
+                "failed": s.failed,
+                "flood_waits": s.flood_waits,
+                "in_flight": s.in_flight,
+                "paused_for": self.paused_for(s),
+            }
+            for s in self.senders
+        ]
@@ -0,0 +1,182 @@
+"""settings 表的进程内缓存，通过 LISTEN/NOTIFY 在多个实例间同步"""
+
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("VVVVVVVVVbot")
+
+SETTINGS_CHANNEL = "bot_settings"
+
+
+class SettingsCache:
+    """带版本号的设置缓存
+
+    每个设置项在数据库中有一个递增的版本号。写入时在同一条语句里更新版本并 pg_notify，
+    所有实例（包括自己）通过一个常驻的 LISTEN 连接收到通知，版本更新时才应用，
+    乱序或重复的通知会被忽略。消息处理路径只读取内存中的值，不访问数据库。
+
+    监听连接断开后在后台重连，并重新装载全部设置，补上断开期间错过的修改。
+    """
+
+    def __init__(
+        self,
+        pool,
+        channel: str = SETTINGS_CHANNEL,
+        reconnect_delay: float = 5.0,
+    ):
+        self.pool = pool
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+
+        self._values: Dict[str, Tuple[str, int]] = {}
+        self._callbacks: Dict[str, List[Callable[[str, int], None]]] = {}
+        self._conn = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+        self.notifications = 0
+        self.applied = 0
+        self.reconnects = 0
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        entry = self._values.get(key)
+        return entry[0] if entry else default
+
+    def version(self, key: str) -> int:
+        entry = self._values.get(key)
+        return entry[1] if entry else 0
+
+    def on_change(self, key: str, callback: Callable[[str, int], None]):
+        """登记设置项变化时的回调 callback(新值, 版本)"""
+        self._callbacks.setdefault(key, []).append(callback)
+
+    async def start(self):
+        """建表、开始监听并装载全部设置"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+                """
+            )
+            await conn.execute(
+                "ALTER TABLE settings ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0"
+            )
+        # 先监听再装载，两者之间的修改不会丢失（重复的由版本号过滤）
+        await self._listen()
+        await self.reload()
+
+    async def reload(self):
+        """从数据库装载全部设置"""
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch("SELECT key, value, version FROM settings")
+        for record in records:
+            self._apply(record["key"], record["value"], record["version"])
+
+    async def set(self, key: str, value: str) -> int:
+        """写入设置并通知所有实例，返回新版本号"""
+        async with self.pool.acquire() as conn:
+            version = await conn.fetchval(
+                """
+                WITH saved AS (
+                    INSERT INTO settings (key, value, version)
+                    VALUES ($1, $2, 1)
+                    ON CONFLICT (key) DO UPDATE
+                    SET value = EXCLUDED.value, version = settings.version + 1
+                    RETURNING key, value, version
+                )
+                SELECT
+                    version,
+                    pg_notify(
+                        $3,
+                        json_build_object(
+                            'key', key, 'value', value, 'version', version
+                        )::text
+                    )
+                FROM saved
+                """,
+                key,
+                value,
+                self.channel,
+            )
+        self._apply(key, value, version)
+        return version
+
+    def _apply(self, key: str, value: str, version: int) -> bool:
+        # 升级前保存的设置版本为0，缓存中还没有该项时任何版本都要应用
+        entry = self._values.get(key)
+        if entry is not None and version <= entry[1]:
+            return False
+        self._values[key] = (value, version)
+        self.applied += 1
+        for callback in self._callbacks.get(key, ()):
+            try:
+                callback(value, version)
+            except Exception as e:
+                logger.error(f"应用设置 {key}={value} 失败: {e}")
+        return True
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.notifications += 1
+        try:
+            data = json.loads(payload)
+            self._apply(data["key"], data["value"], int(data["version"]))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"忽略无效的设置通知 {payload!r}: {e}")
+
+    def _on_terminate(self, conn):
+        if self._closed:
+            return
+        logger.warning("设置监听连接已断开，将在后台重连")
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _listen(self):
+        self._conn = await self.pool.acquire()
+        self._conn.add_termination_listener(self._on_terminate)
+        await self._conn.add_listener(self.channel, self._on_notify)
+
+    async def _release(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.remove_termination_listener(self._on_terminate)
+            if not conn.is_closed():
+                await conn.remove_listener(self.channel, self._on_notify)
+            await self.pool.release(conn)
+        except Exception as e:
+            logger.debug("释放设置监听连接失败: %s", e)
+
+    async def _reconnect(self):
+        while not self._closed:
+            await asyncio.sleep(self.reconnect_delay)
+            await self._release()
+            try:
+                await self._listen()
+                await self.reload()
+            except Exception as e:
+                logger.error(f"重连设置监听失败: {e}")
+                continue
+            self.reconnects += 1
+            logger.info("设置监听已重连")
+            return
+
+    async def close(self):
+        """停止监听并归还连接"""
+        self._closed = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        await self._release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keys": len(self._values),
+            "notifications": self.notifications,
+            "applied": self.applied,
+            "reconnects": self.reconnects,
+        }
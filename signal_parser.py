@@ -0,0 +1,210 @@
+"""VVVVVVVVV信号解析器
+
+原实现对每条消息按字段依次执行最多22个未编译的 re.search, 每次调用都要经过 re 模块的
+缓存查找。这里所有模式在导入时编译一次, 并且只在必需出现的关键字存在时才运行:
+每个字段先用 C 实现的子串查找判断整组模式的公共关键字, 不存在时整组跳过; 存在时按旧
+实现的优先级用 or 链依次尝试, 命中即停。每条消息的开销主要是解释器执行的字节码,
+所以字段逻辑直接展开在 parse_signal 中, 不经过通用的循环和函数调用。
+
+机器人自己的标准模板(CA、等级、评分、市值、粉丝数各占一行且都用第一优先级的写法)
+先用一个正则一次取出全部字段。只有当模板之前没有出现这些关键字时才采用这个结果,
+此时每个字段第一优先级模式的首个匹配就在模板里, 与逐字段解析的结果相同。
+
+各字段仍按旧实现的优先级逐个尝试, 所以输出与旧实现逐字段一致; 被前一个模式完全覆盖
+的模式(旧版 CA 的第4、6个模式)不可能改变结果, 已去掉。
+"""
+
+import re
+from typing import Any, Dict, Optional
+
+# 各字段的模式, 按优先级编号
+_ca_search_1 = re.compile(r"🪙CA地址: (\S+)").search
+_ca_search_2 = re.compile(r"🪙\s*CA地址\s*:\s*(\S+)").search
+_ca_search_3 = re.compile(r"CA地址\s*:\s*(\S+)").search
+_ca_search_4 = re.compile(r"CA\s*:\s*(\S+)").search
+
+# 没有任何CA标签时, 直接匹配地址格式
+_raw_ca_search = re.compile(r"[a-zA-Z0-9]{40,42}").search
+
+_level_search_1 = re.compile(r"等级: (\w+)").search
+_level_search_2 = re.compile(r"等级\s*:\s*(\w+)").search
+_level_search_3 = re.compile(r"level\s*:\s*(\w+)").search
+_level_search_4 = re.compile(r"Level\s*:\s*(\w+)").search
+
+_twitter_search_1 = re.compile(r"📊Twiiter评分: (\d+)分").search
+_twitter_search_2 = re.compile(r"Twiiter评分: (\d+)").search
+_twitter_search_3 = re.compile(r"Twitter评分: (\d+)").search
+_twitter_search_4 = re.compile(r"推特评分: (\d+)").search
+
+_market_search_1 = re.compile(r"💰当前市值: (\d+)\s*K").search
+_market_search_2 = re.compile(r"当前市值: (\d+)").search
+_market_search_3 = re.compile(r"市值: (\d+)").search
+
+_followers_search_1 = re.compile(r"🙎粉丝数: (\d+)").search
+_followers_search_2 = re.compile(r"粉丝数: (\d+)").search
+_followers_search_3 = re.compile(r"followers: (\d+)").search
+_followers_search_4 = re.compile(r"Followers: (\d+)").search
+
+# 标准模板: 各字段第一优先级的模式按行排列。捕获组后紧跟的字符都不可能属于该捕获组,
+# 所以贪婪匹配得到的值与单独搜索该字段时相同
+_template_search = re.compile(
+    r"🪙CA地址: (\S+)\n等级: (\w+)\n📊Twiiter评分: (\d+)分\n"
+    r"💰当前市值: (\d+)\s*K\n🙎粉丝数: (\d+)"
+).search
+# 模板之前出现任一关键字时, 该字段的首个匹配可能不在模板里, 改为逐字段解析
+_template_keyword_search = re.compile(
+    "🪙CA地址: |等级: |📊Twiiter评分: |💰当前市值: |🙎粉丝数: "
+).search
+
+# 等级优先级: Bad < Normal < Good < Excellent, 未知等级按最低处理
+LEVEL_PRIORITY = {
+    "Bad": 0,
+    "Normal": 1,
+    "Good": 2,
+    "Excellent": 3,
+    "Unknown": -1,
+}
+
+# 未匹配到等级时, 按此顺序从消息内容推断
+_LEVEL_HINTS = (
+    ("excellent", "Excellent"),
+    ("good", "Good"),
+    ("normal", "Normal"),
+    ("bad", "Bad"),
+)
+
+
+def parse_signal(message_text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """解析VVVVVVVVV消息，提取CA地址和等级等信息"""
+    if not message_text:
+        return None
+    text = message_text
+
+    # 所有CA模式都包含"CA"
+    match = None
+    if "CA" in text:
+        if "🪙CA地址: " in text:
+            template = _template_search(text)
+            if template is not None:
+                start = template.start()
+                if not start or _template_keyword_search(text, 0, start) is None:
+                    ca_address, level, twitter_score, market_value, followers = (
+                        template.groups()
+                    )
+                    # 等级恰好是"Unknown"时需要推断, 走下面的完整流程
+                    if level != "Unknown":
+                        return {
+                            "ca_address": ca_address,
+                            "level": level,
+                            "twitter_score": int(twitter_score),
+                            "current_market_value": int(market_value),
+                            "followers": int(followers),
+                            "raw_message": text,
+                        }
+        if "CA地址" in text:
+            match = (
+                _ca_search_1(text)
+                or _ca_search_2(text)
+                or _ca_search_3(text)
+                or _ca_search_4(text)
+            )
+        else:
+            match = _ca_search_4(text)
+
+    if match:
+        ca_address = match.group(1)
+    else:
+        # 裸地址至少40个字符
+        if len(text) < 40:
+            return None
+        match = _raw_ca_search(text)
+        if not match:
+            return None
+        ca_address = match.group()
+
+    match = None
+    if "等级" in text:
+        match = _level_search_1(text) or _level_search_2(text)
+    if not match and "evel" in text:
+        match = _level_search_3(text) or _level_search_4(text)
+    level = match.group(1) if match else "Unknown"
+    # 旧实现在匹配到的等级恰好是"Unknown"时同样会走推断逻辑
+    if level == "Unknown":
+        lowered = text.lower()
+        for hint, name in _LEVEL_HINTS:
+            if hint in lowered:
+                level = name
+                break
+
+    twitter_score = 0
+    if "评分: " in text:
+        match = (
+            _twitter_search_1(text)
+            or _twitter_search_2(text)
+            or _twitter_search_3(text)
+            or _twitter_search_4(text)
+        )
+        if match:
+            twitter_score = int(match.group(1))
+
+    current_market_value = 0
+    if "市值: " in text:
+        match = _market_search_1(text) or _market_search_2(text) or _market_search_3(text)
+        if match:
+            current_market_value = int(match.group(1))
+
+    match = None
+    if "粉丝数: " in text:
+        match = _followers_search_1(text) or _followers_search_2(text)
+    if not match and "ollowers: " in text:
+        match = _followers_search_3(text) or _followers_search_4(text)
+    followers = int(match.group(1)) if match else 0
+
+    return {
+        "ca_address": ca_address,
+        "level": level,
+        "twitter_score": twitter_score,
+        "current_market_value": current_market_value,
+        "followers": followers,
+        "raw_message": text,
+    }
+
+
+# has_raw_address 用: 字母数字映射为 "a", 其余字节映射为空格, 再查找连续40个 "a"
+_ALNUM_TABLE = bytes(
+    0x61 if chr(i).isascii() and chr(i).isalnum() else 0x20 for i in range(256)
+)
+_ADDRESS_RUN = b"a" * 40
+
+
+def has_raw_address(text: str) -> bool:
+    """是否含有裸地址格式的字符串(没有CA标签时 parse_signal 据此提取地址)
+
+    结果与 _raw_ca_search 相同, 但不逐个位置尝试正则: ASCII 字符不到40个时直接返回,
+    否则把非 ASCII 字符替换为 "?" 后在 C 实现的 translate 和子串查找中完成判断。
+    """
+    if len(text) < 40:
+        return False
+    if text.isascii():
+        data = text.encode()
+    else:
+        if len(text.encode("ascii", "ignore")) < 40:
+            return False
+        data = text.encode("ascii", "replace")
+    return _ADDRESS_RUN in data.translate(_ALNUM_TABLE)
+
+
+def level_passes(message_level: str, current_level: str) -> bool:
+    """消息等级是否达到当前筛选等级, 筛选等级为All时全部通过"""
+    if current_level == "All":
+        return True
+    # 消息中没有等级或等级无效时按最低级别处理, 无效的筛选等级按Normal处理
+    return LEVEL_PRIORITY.get(message_level, -1) >= LEVEL_PRIORITY.get(current_level, 1)
+
+
+def signal_priority(data: Dict[str, Any], use_score: bool = False) -> float:
+    """发送优先级, 等级越高越优先; use_score 时推特评分(0~100)在同一等级内再细分, 不跨等级"""
+    priority = float(LEVEL_PRIORITY.get(data["level"], -1))
+    if use_score:
+        priority += min(max(data["twitter_score"], 0), 100) / 101
+    return priority
@@ -0,0 +1,121 @@
+"""按目标设置筛选等级和规则，预先计算每个等级对应的接收目标"""
+
+import json
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from filter_rules import CompiledRule, compile_rule
+from signal_parser import LEVEL_PRIORITY, level_passes
+
+
+class _Route:
+    __slots__ = ("targets", "rule_groups")
+
+    def __init__(self, targets, rule_groups):
+        # 只按等级就能确定的目标
+        self.targets: Tuple[int, ...] = targets
+        # (规则, 目标) 分组，同一规则只判断一次
+        self.rule_groups: Tuple[Tuple[CompiledRule, Tuple[int, ...]], ...] = rule_groups
+
+
+class TargetRouter:
+    """消息等级 -> 接收目标 的索引
+
+    每个目标可以有自己的最低等级（没有设置时跟随全局筛选等级）和规则。索引只在配置或
+    全局等级变化时重建，处理消息时按等级查一次字典；设置了规则的目标按规则分组，每条
+    消息对每个不同的规则只判断一次。
+    """
+
+    def __init__(self):
+        self._index: Dict[str, _Route] = {}
+        self._unknown = _Route((), ())
+        self.levels: Dict[int, str] = {}
+        self.rules: Dict[int, CompiledRule] = {}
+        self.default_level: Optional[str] = None
+
+    def build(
+        self,
+        targets: Sequence[int],
+        default_level: str,
+        levels: Optional[Dict[int, str]] = None,
+        rules: Optional[Dict[int, CompiledRule]] = None,
+    ):
+        """重建索引，完成后整体替换"""
+        levels = dict(levels or {})
+        rules = dict(rules or {})
+        index: Dict[str, _Route] = {}
+        for message_level in LEVEL_PRIORITY:
+            plain = []
+            grouped: Dict[CompiledRule, list] = {}
+            for target in targets:
+                if not level_passes(message_level, levels.get(target, default_level)):
+                    continue
+                rule = rules.get(target)
+                if rule is None:
+                    plain.append(target)
+                else:
+                    grouped.setdefault(rule, []).append(target)
+            index[message_level] = _Route(
+                tuple(plain),
+                tuple((rule, tuple(group)) for rule, group in grouped.items()),
+            )
+
+        self._index = index
+        self._unknown = index["Unknown"]
+        self.levels = levels
+        self.rules = rules
+        self.default_level = default_level
+
+    def recipients(self, data: Dict[str, Any]) -> Tuple[int, ...]:
+        """返回应接收这条消息的目标"""
+        route = self._index.get(data["level"], self._unknown)
+        if not route.rule_groups:
+            return route.targets
+        recipients = list(route.targets)
+        for rule, targets in route.rule_groups:
+            if rule.predicate(data):
+                recipients.extend(targets)
+        return tuple(recipients)
+
+    def describe(self, target: int) -> str:
+        """目标的筛选条件，用于状态展示"""
+        level = self.levels.get(target)
+        text = f"等级 {level}" if level else f"等级 {self.default_level}（全局）"
+        rule = self.rules.get(target)
+        if rule is not None:
+            text += f"，规则 {rule.source}"
+        return text
+
+
+def parse_target_levels(value: str, valid_levels: Iterable[str]) -> Dict[int, str]:
+    """解析 "目标ID:等级,目标ID:等级" 格式的配置"""
+    valid_levels = set(valid_levels)
+    levels: Dict[int, str] = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        chat_id, sep, level = item.rpartition(":")
+        if not sep or level.strip() not in valid_levels:
+            raise ValueError(f"无效的目标等级配置: {item}")
+        levels[int(chat_id.strip())] = level.strip()
+    return levels
+
+
+def parse_target_rules(value: str) -> Dict[int, CompiledRule]:
+    """解析 {"目标ID": "规则"} 格式的JSON配置，相同的规则只编译一次"""
+    if not value.strip():
+        return {}
+    try:
+        data = json.loads(value)
+    except ValueError as e:
+        raise ValueError(f"目标规则配置不是有效的JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("目标规则配置应为 {\"目标ID\": \"规则\"} 格式")
+
+    compiled: Dict[str, CompiledRule] = {}
+    rules: Dict[int, CompiledRule] = {}
+    for chat_id, source in data.items():
+        if source not in compiled:
+            compiled[source] = compile_rule(source)
+        rules[int(chat_id)] = compiled[source]
+    return rules